@@ -1,7 +1,7 @@
 import json
 
 from django.utils.six.moves.urllib.parse import urlencode
-from django.utils.six.moves.urllib.request import urlopen
+from django.utils.six.moves.urllib.request import Request, urlopen
 from django.core.management.base import CommandError
 
 
@@ -10,6 +10,8 @@ def call(method, data, post=False):
     Calls `method` from the DISQUS API with data either in POST or GET.
     Returns deserialized JSON response.
     """
+    from disqus.api import DecompressingReader
+
     url = "%s%s" % ('http://disqus.com/api/', method)
     if post:
         # POST request
@@ -19,7 +21,9 @@ def call(method, data, post=False):
         # GET request
         url += "?%s" % urlencode(data)
         data = ''
-    res = json.load(urlopen(url, data))
+    request = Request(url, data)
+    request.add_header('Accept-Encoding', 'gzip, deflate')
+    res = json.load(DecompressingReader(urlopen(request)))
     if not res['succeeded']:
         raise CommandError("'%s' failed: %s\nData: %s" % (method, res['code'], data))
     return res['message']
@@ -1,7 +1,23 @@
+import bisect
+import codecs
+import errno
+from collections import deque, OrderedDict
+import functools
+import hashlib
 import json
+from multiprocessing.pool import ThreadPool
+import numbers
+import random
+import socket
+import threading
+import time
+import zlib
+from io import BytesIO
 
-from django.utils.six.moves.urllib.parse import urlencode
-from django.utils.six.moves.urllib.error import URLError
+from django.utils import six
+from django.utils.six.moves import http_client
+from django.utils.six.moves.urllib.parse import urlencode, urlsplit
+from django.utils.six.moves.urllib.error import HTTPError, URLError
 from django.utils.six.moves.urllib.request import (
     ProxyHandler,
     Request,
@@ -9,7 +25,41 @@ from django.utils.six.moves.urllib.request import (
     build_opener,
     install_opener
 )
+try:
+    from django.utils.encoding import force_text
+except ImportError:
+    # Django < 1.5
+    from django.utils.encoding import force_unicode as force_text
 
+from disqus import signals
+
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = None
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python < 3.4
+    asyncio = None
+
+
+try:
+    # Raised when the server closed the connection without any response
+    NO_RESPONSE_ERRORS = (http_client.RemoteDisconnected,)
+except AttributeError:
+    # Python < 3.5
+    NO_RESPONSE_ERRORS = (http_client.BadStatusLine,)
+
+
+def _closed_before_response(error):
+    """
+    Whether `error` shows that the server closed the connection before it
+    sent any of the response.
+    """
+    return (isinstance(error, NO_RESPONSE_ERRORS) or
+            getattr(error, 'errno', None) in (errno.ECONNRESET, errno.EPIPE))
 
 # A custom ProxyHandler that will not auto-detect proxy settings
 proxy_support = ProxyHandler({})
@@ -21,13 +71,639 @@ class DisqusException(Exception):
     """Exception raised for errors with the DISQUS API."""
     pass
 
-class DisqusClient(object):
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP/1.1 keep-alive connections.
+
+    Idle connections are kept per host and reused across requests. A
+    connection is closed when it has been idle for more than
+    `idle_timeout` seconds or has served `max_requests` requests. At most
+    `maxsize` idle connections are kept per host.
+
+    Example:
+        >>> pool = ConnectionPool(maxsize=4, idle_timeout=30)
+        >>> client = DisqusClient(pool=pool)
+    """
+    connection_classes = {
+        'http': http_client.HTTPConnection,
+        'https': http_client.HTTPSConnection,
+    }
+    def __init__(self, maxsize=4, idle_timeout=60, max_requests=100,
+                 timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _get_connection(self, key):
+        """
+        Return a `(connection, request_count)` tuple for the given
+        `(scheme, host)` key, reusing an idle connection if possible.
+        """
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used, request_count = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return conn, request_count
+                conn.close()
+        scheme, host = key
+        conn = self.connection_classes[scheme](host, timeout=self.timeout)
+        return conn, 0
+
+    def _put_connection(self, key, conn, request_count):
+        """Return a connection to the pool or close it if it is used up."""
+        if not self.max_requests or request_count < self.max_requests:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.maxsize:
+                    idle.append((conn, time.time(), request_count))
+                    return
+        conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, last_used, request_count in connections:
+                conn.close()
+
+    def urlopen(self, request):
+        """
+        Send `request` over a pooled connection and return a file-like
+        response object, just like `urlopen` would.
+        URLError is raised when the connection failed and HTTPError when
+        the server responded with an error status.
+        """
+        url = request.get_full_url()
+        scheme, host, path, query, fragment = urlsplit(url)
+        selector = path + ('?' + query if query else '')
+        headers = dict(request.header_items())
+        if request.data is not None and not [h for h in headers
+                                             if h.lower() == 'content-type']:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        key = (scheme, host)
+        method = request.get_method()
+
+        while True:
+            conn, request_count = self._get_connection(key)
+            sent = False
+            try:
+                conn.request(method, selector, request.data, headers)
+                sent = True
+                response = conn.getresponse()
+            except (socket.error, http_client.HTTPException) as e:
+                conn.close()
+                if request_count and (not sent or
+                                      _closed_before_response(e)):
+                    # The server closed a kept-alive connection before
+                    # it handled the request, retry on a fresh one.
+                    continue
+                raise URLError(e)
+            break
+
+        response = PooledResponse(self, key, conn, request_count + 1,
+                                  response, url)
+        if not 200 <= response.code < 300:
+            body = response.read()
+            raise HTTPError(url, response.code, response.response.reason,
+                            response.msg, BytesIO(body))
+        return response
+
+
+class PooledResponse(object):
+    """
+    The response of a request over a pooled connection, which is read from
+    the connection as it is consumed. The connection is given back to the
+    pool once the body was read completely, or closed if the response is
+    closed before.
+    """
+
+    def __init__(self, pool, key, conn, request_count, response, url):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.request_count = request_count
+        self.response = response
+        self.url = url
+        self.code = response.status
+        self.msg = response.msg
+
+    def info(self):
+        return self.msg
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def _release(self, reuse):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if reuse and not self.response.will_close:
+            self.pool._put_connection(self.key, conn, self.request_count)
+        else:
+            conn.close()
+
+    def read(self, size=None):
+        if self.conn is None and self.response.isclosed():
+            return b''
+        try:
+            if size is None or size < 0:
+                data = self.response.read()
+            else:
+                data = self.response.read(size)
+        except (socket.error, http_client.HTTPException) as e:
+            self._release(False)
+            raise URLError(e)
+        if self.response.isclosed():
+            # The whole body was read
+            self._release(True)
+        return data
+
+    def close(self):
+        self._release(self.response.isclosed())
+        self.response.close()
+
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket that lets through `rate` requests per
+    second on average, with bursts of up to `burst` requests. The total
+    time requests were held back is kept in `throttled`.
+
+    Example:
+        >>> client = DisqusClient(rate_limiter=RateLimiter(rate=5))
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.throttled = 0.0
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until the next request may be sent and return the number of
+        seconds waited.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            # The token is taken right away, so concurrent callers queue
+            # up behind each other.
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, 0)
+            self.throttled += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class DecompressingReader(object):
+    """
+    Wraps a response and decompresses it while it is read if it was sent
+    with gzip or deflate Content-Encoding. The number of bytes read from
+    the response and returned after decoding are counted in
+    `bytes_received` and `bytes_decoded`.
+    """
+    chunk_size = 65536
+
+    def __init__(self, response):
+        self.response = response
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._buffer = b''
+        self._eof = False
+        encoding = response.info().get('Content-Encoding')
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = None
+
+    def __getattr__(self, attr):
+        return getattr(self.response, attr)
+
+    def _decompress(self, data):
+        try:
+            return self._decompressor.decompress(data)
+        except zlib.error:
+            if self.bytes_received != len(data):
+                raise
+            # Some servers send raw deflate data without the zlib header.
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(data)
+
+    def _read_chunk(self, size=None):
+        if size is None:
+            data = self.response.read()
+            self._eof = True
+        else:
+            data = self.response.read(size)
+            self._eof = not data
+        self.bytes_received += len(data)
+        if self._decompressor is None:
+            return data
+        if data:
+            data = self._decompress(data)
+        if self._eof:
+            data += self._decompressor.flush()
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._read_chunk() if not self._eof else b''
+            if self._buffer:
+                data = self._buffer + data
+                self._buffer = b''
+        else:
+            while len(self._buffer) < size and not self._eof:
+                self._buffer += self._read_chunk(self.chunk_size)
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_decoded += len(data)
+        return data
+
+    def close(self):
+        self.response.close()
+
+
+def json_decoder(data):
+    """Decode a JSON response body with the standard library."""
+    if isinstance(data, bytes) and not isinstance(data, str):
+        # json.loads only accepts bytes since Python 3.6
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def fast_json_decoder():
+    """
+    Return a faster JSON decoder if ujson is installed, otherwise the
+    standard library decoder.
+    """
+    if fast_json is None:
+        return json_decoder
+    return fast_json.loads
+
+
+def iter_message(fp, chunk_size=65536):
+    """
+    Yield the items of the `message` array of a DISQUS API response as
+    they are read from `fp`, without reading the whole response into
+    memory. A message that isn't an array is yielded as a single item.
+    DisqusException is raised when the query didn't succeed.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    state = {'buf': '', 'pos': 0, 'eof': False}
+
+    def fill():
+        if state['eof']:
+            return False
+        data = fp.read(chunk_size)
+        state['eof'] = not data
+        buf = state['buf'][state['pos']:]
+        state['buf'] = buf + text_decoder.decode(data, final=not data)
+        state['pos'] = 0
+        return True
+
+    def peek():
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                raise ValueError("Unexpected end of JSON response")
+
+    def expect(chars):
+        char = peek()
+        if char not in chars:
+            raise ValueError("Expected %r in JSON response, got %r" % (
+                chars, char))
+        state['pos'] += 1
+        return char
+
+    def value():
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(state['buf'], state['pos'])
+            except ValueError:
+                if not fill():
+                    raise
+                continue
+            # Unlike other values, a number could be cut off at the end of
+            # the buffer, so it's only used once more data was read.
+            if (isinstance(obj, numbers.Number) and
+                    (end == len(state['buf']) or
+                     state['buf'][end] in '.eE+-0123456789') and fill()):
+                continue
+            state['pos'] = end
+            return obj
+
+    fields = {}
+    expect('{')
+    if peek() == '}':
+        raise ValueError("Empty JSON response")
+    while True:
+        key = value()
+        expect(':')
+        if key == 'message' and peek() == '[':
+            state['pos'] += 1
+            if peek() == ']':
+                state['pos'] += 1
+            else:
+                while True:
+                    yield value()
+                    if expect(',]') == ']':
+                        break
+        else:
+            fields[key] = value()
+        if expect(',}') == '}':
+            break
+    if not fields.get('succeeded'):
+        raise DisqusException(fields.get('message'))
+    if 'message' in fields:
+        yield fields['message']
+
+
+class Observer(object):
+    """
+    Base class for the observers of a `DisqusClient`. Subclasses override
+    the hooks they are interested in. Hooks are called from the thread that
+    makes the call and have to be thread-safe.
+    """
+    def pre_request(self, method, params):
+        """Called before the request of `method` is sent."""
+
+    def post_response(self, method, params, elapsed, size):
+        """
+        Called after the response of `method` was read, `elapsed` seconds
+        after the request was started. `size` is the number of bytes
+        received.
+        """
+
+    def request_error(self, method, params, error, elapsed):
+        """Called when the call of `method` raised `error`."""
+
+
+class MetricsCollector(Observer):
+    """
+    Observer that collects per-method call counts, errors, received bytes
+    and a latency histogram.
+    """
+    # Upper bounds of the latency histogram buckets, from 1ms to about 70s
+    BUCKETS = tuple(0.001 * 1.25 ** i for i in range(51))
+
+    def __init__(self):
+        self.methods = {}
+        self._lock = threading.Lock()
+
+    def _record(self, method, elapsed, size=0, error=False):
+        bucket = bisect.bisect_left(self.BUCKETS, elapsed)
+        with self._lock:
+            stats = self.methods.get(method)
+            if stats is None:
+                stats = self.methods[method] = {
+                    'calls': 0,
+                    'errors': 0,
+                    'bytes_received': 0,
+                    'total_time': 0.0,
+                    'max_time': 0.0,
+                    'histogram': [0] * (len(self.BUCKETS) + 1),
+                }
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['bytes_received'] += size
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            stats['histogram'][bucket] += 1
+
+    def post_response(self, method, params, elapsed, size):
+        self._record(method, elapsed, size)
+
+    def request_error(self, method, params, error, elapsed):
+        self._record(method, elapsed, error=True)
+
+    def _percentile(self, stats, percent):
+        """
+        Return the upper bound of the histogram bucket that holds the
+        `percent` percentile, or the slowest call if it is faster.
+        """
+        rank = stats['calls'] * percent / 100.0
+        count = 0
+        for bound, calls in zip(self.BUCKETS, stats['histogram']):
+            count += calls
+            if count >= rank:
+                return min(bound, stats['max_time'])
+        return stats['max_time']
+
+    def as_dict(self):
+        """
+        Return the metrics as a dict of methods, each with the number of
+        `calls` and `errors`, the `error_rate`, the `bytes_received` and the
+        `mean`, `p50`, `p95`, `p99` and `max` latency in seconds.
+        """
+        with self._lock:
+            return dict((method, {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'error_rate': float(stats['errors']) / stats['calls'],
+                'bytes_received': stats['bytes_received'],
+                'latency': {
+                    'mean': stats['total_time'] / stats['calls'],
+                    'p50': self._percentile(stats, 50),
+                    'p95': self._percentile(stats, 95),
+                    'p99': self._percentile(stats, 99),
+                    'max': stats['max_time'],
+                },
+            }) for method, stats in self.methods.items())
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    A thread-safe in-memory cache for API responses that keeps at most
+    `maxsize` responses for `ttl` seconds each, evicting the least
+    recently used response first.
+
+    Example:
+        >>> client = DisqusClient(cache=LRUCache(maxsize=256, ttl=600))
+    """
+
+    def __init__(self, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._responses.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires <= time.time():
+                self.misses += 1
+                return default
+            # re-insert to mark the response as recently used
+            self._responses[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._responses.pop(key, None)
+            self._responses[key] = (time.time() + self.ttl, value)
+            while len(self._responses) > self.maxsize:
+                self._responses.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return the hit, miss and eviction counts as a dict."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class DjangoCache(object):
+    """
+    Caches API responses in one of the caches configured in the
+    CACHES setting, so they are shared between processes and runs.
+    Evictions are left to the cache backend and are not counted.
+
+    Example:
+        >>> client = DisqusClient(cache=DjangoCache('default', ttl=3600))
+    """
+
+    def __init__(self, alias='default', ttl=300, key_prefix='disqus'):
+        try:
+            from django.core.cache import caches
+            self.cache = caches[alias]
+        except ImportError:
+            # Django < 1.7
+            from django.core.cache import get_cache
+            self.cache = get_cache(alias)
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _make_key(self, key):
+        # Keys can be longer than or contain characters not supported by
+        # memcached, so they are hashed.
+        return '%s:%s' % (self.key_prefix,
+                          hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def get(self, key, default=None):
+        value = self.cache.get(self._make_key(key), _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache.set(self._make_key(key), value, self.ttl)
+
+    def stats(self):
+        """Return the hit, miss and eviction counts as a dict."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def _make_api_method(name, http_method, api_call):
+    """
+    Return a method that calls the DISQUS API method `name` through the
+    client method named `api_call`.
+    """
+    def api_method(self, **params):
+        return getattr(self, api_call)(name, **params)
+    api_method.__name__ = str(name)
+    api_method.__doc__ = (
+        "Call the DISQUS API method `%s` with a %s request through `%s`."
+        % (name, http_method, api_call))
+    return api_method
+
+
+class ApiMethodsType(type):
+    """
+    Metaclass that adds a method for each DISQUS API method in `METHODS`
+    to the class, unless the class defines it itself.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(ApiMethodsType, cls).__init__(name, bases, attrs)
+        for method, http_method in cls.METHODS.items():
+            if method not in attrs:
+                setattr(cls, method,
+                        _make_api_method(method, http_method, cls.api_call))
+
+
+class DisqusClient(six.with_metaclass(ApiMethodsType, object)):
     """
     Client for the DISQUS API.
 
     Example:
         >>> client = DisqusClient()
         >>> json = client.get_forum_list(user_api_key=DISQUS_API_KEY)
+
+    Pass a `ConnectionPool` as `pool` to reuse keep-alive connections
+    between calls:
+
+        >>> client = DisqusClient(pool=ConnectionPool(maxsize=4))
+
+    Failed requests are retried up to `retries` times with exponential
+    backoff, and a `RateLimiter` limits the number of requests per second:
+
+        >>> client = DisqusClient(retries=5, rate_limiter=RateLimiter(rate=5))
+
+    Responses are decoded with `decoder`, the standard library JSON decoder
+    by default:
+
+        >>> client = DisqusClient(decoder=fast_json_decoder())
+
+    Pass a `LRUCache` or `DjangoCache` as `cache` to cache the responses
+    of GET methods, optionally limited to the methods in `cache_methods`:
+
+        >>> client = DisqusClient(cache=LRUCache(),
+        ...                       cache_methods=['get_forum_list'])
+
+    Params in `default_params` are sent with every call, unless the call
+    passes them itself. They are encoded only once:
+
+        >>> client = DisqusClient(default_params={'forum_api_key': key})
+        >>> posts = client.get_thread_posts(thread_id=thread_id)
+
+    Every call is reported to the `Observer` instances in `observers` and
+    through the signals in `disqus.signals`:
+
+        >>> metrics = MetricsCollector()
+        >>> client = DisqusClient(observers=[metrics])
     """
     METHODS = {
         'create_post': 'POST',
@@ -44,51 +720,415 @@ class DisqusClient(object):
         'thread_by_identifier': 'POST',
         'update_thread': 'POST',
     }
+    api_url = 'http://disqus.com/api/%s/?api_version=1.1'
+    # The name of the method that the API methods are dispatched to
+    api_call = 'call'
+    default_params = None
+    pool = None
+    cache = None
+    cache_methods = None
+    batch_url = None
+    compress = True
+    decoder = None
+    rate_limiter = None
+    observers = ()
+    retries = 0
+    backoff = 0.5
+    max_backoff = 60
+    # HTTP status codes of responses that are retried
+    RETRY_CODES = (429, 500, 502, 503, 504)
+    # The subset that is retried for POST requests, since the server
+    # rejected them without processing them
+    POST_RETRY_CODES = (429, 503)
 
     def __init__(self, **kwargs):
-        self.api_url = 'http://disqus.com/api/%s/?api_version=1.1'
+        self.retry_count = 0
+        self.throttled = 0.0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._default_query = None
         self.__dict__.update(kwargs)
 
+    @classmethod
+    def from_settings(cls, workers=1, rate_limit=None, **kwargs):
+        """
+        Return a client for the DISQUS_API_URL and DISQUS_API_BATCH_URL
+        settings, with a pool of connections for `workers` threads. The
+        forums and their API keys are cached in the cache named by the
+        DISQUS_API_CACHE setting for DISQUS_API_CACHE_TTL seconds, and
+        requests are limited to `rate_limit` per second if it is given.
+        The other keyword arguments are set on the client.
+        """
+        from django.conf import settings
+
+        if getattr(settings, 'DISQUS_API_CACHE', None):
+            kwargs.setdefault('cache', DjangoCache(
+                settings.DISQUS_API_CACHE,
+                ttl=getattr(settings, 'DISQUS_API_CACHE_TTL', 3600)))
+            kwargs.setdefault('cache_methods', ['get_forum_list',
+                                                'get_forum_api_key'])
+        if rate_limit:
+            kwargs.setdefault('rate_limiter',
+                              RateLimiter(rate_limit, burst=workers))
+        kwargs.setdefault('api_url', getattr(settings, 'DISQUS_API_URL',
+                                             cls.api_url))
+        kwargs.setdefault('batch_url', getattr(settings,
+                                               'DISQUS_API_BATCH_URL', None))
+        kwargs.setdefault('pool', ConnectionPool(maxsize=workers))
+        return cls(**kwargs)
+
     def __getattr__(self, attr):
         """
         Called when an attribute is not found in the usual places
         (__dict__, class tree) this method will check if the attribute
-        name is a DISQUS API method and call the `call` method.
+        name is a DISQUS API method that was added to METHODS after the
+        class was created and call the `api_call` method.
         If it isn't in the METHODS dict, it will raise an AttributeError.
         """
         if attr in self.METHODS:
-            def call_method(**kwargs):
-                return self.call(attr, **kwargs)
-            return call_method
-        raise AttributeError
+            return functools.partial(getattr(self, self.api_call), attr)
+        raise AttributeError(attr)
+
+    def _get_endpoint(self, method):
+        """
+        Return the url and HTTP method of the API method `method`. The urls
+        of all methods are formatted once per `api_url`.
+        """
+        try:
+            return self._endpoints[self.api_url][method]
+        except KeyError:
+            api_url = self.api_url
+            self._endpoints[api_url] = dict(
+                (name, (api_url % name, http_method))
+                for name, http_method in self.METHODS.items())
+            return self._endpoints[api_url][method]
+
+    def _get_default_query(self, params):
+        """
+        Return the urlencoded `default_params` that are not overridden by
+        `params`. The encoding is cached as long as `default_params` isn't
+        replaced.
+        """
+        defaults = self.default_params
+        if not defaults:
+            return ''
+        if [key for key in defaults if key in params]:
+            return urlencode(dict((key, value)
+                                  for key, value in defaults.items()
+                                  if key not in params), doseq=1)
+        cached = self._default_query
+        if cached is None or cached[0] is not defaults:
+            self._default_query = (defaults, urlencode(defaults, doseq=1))
+        return self._default_query[1]
 
     def _get_request(self, request_url, request_method, **params):
         """
         Return a Request object that has the GET parameters
         attached to the url or the POST data attached to the object.
         """
+        query = self._get_default_query(params)
+        if params:
+            query = '&'.join(filter(None, (query, urlencode(params, doseq=1))))
         if request_method == 'GET':
-            if params:
-                request_url += '&%s' % urlencode(params)
+            if query:
+                request_url += '&%s' % query
             request = Request(request_url)
         elif request_method == 'POST':
-            request = Request(request_url, urlencode(params, doseq=1))
+            request = Request(request_url, query)
+        if self.compress:
+            request.add_header('Accept-Encoding', 'gzip, deflate')
         return request
 
+    def _urlopen(self, request):
+        """
+        Open the request, over a pooled connection if the client has one.
+        """
+        if self.pool is not None:
+            return self.pool.urlopen(request)
+        return urlopen(request)
+
+    def _get_retry_delay(self, attempt, error, http_method='GET'):
+        """
+        Return the number of seconds to wait before retrying a request
+        that failed with `error`, or None if it shouldn't be retried.
+        """
+        if attempt >= self.retries:
+            return None
+        if isinstance(error, HTTPError):
+            codes = (self.RETRY_CODES if http_method == 'GET'
+                     else self.POST_RETRY_CODES)
+            if error.code not in codes:
+                return None
+            headers = error.info()
+            retry_after = headers and headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(int(retry_after), self.max_backoff)
+        # exponential backoff with jitter
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1)
+
+    def _send(self, request, http_method):
+        """
+        Open the request, retrying it when it fails with a retryable HTTP
+        status. Other errors are only retried for GET requests, since POST
+        requests might have been processed already.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                waited = self.rate_limiter.acquire()
+                if waited:
+                    with self._lock:
+                        self.throttled += waited
+            try:
+                return DecompressingReader(self._urlopen(request))
+            except URLError as e:
+                if not isinstance(e, HTTPError) and http_method != 'GET':
+                    raise
+                delay = self._get_retry_delay(attempt, e, http_method)
+                if delay is None:
+                    raise
+            with self._lock:
+                self.retry_count += 1
+                self.throttled += delay
+            time.sleep(delay)
+            attempt += 1
+
+    def _count_bytes(self, response):
+        with self._lock:
+            self.bytes_received += response.bytes_received
+            self.bytes_decoded += response.bytes_decoded
+
+    def _get_cache_key(self, url, params):
+        """Return the cache key for a call, independent of param order."""
+        if self.default_params:
+            params = dict(self.default_params, **params)
+        return '%s&%s' % (url, urlencode(sorted(params.items()), doseq=1))
+
+    def _is_cached(self, method):
+        """Return True if the responses of `method` may be cached."""
+        if self.cache is None or self.METHODS[method] != 'GET':
+            return False
+        return self.cache_methods is None or method in self.cache_methods
+
+    def _notify(self, hook, **kwargs):
+        """Call `hook` of the observers and send the matching signal."""
+        for observer in self.observers:
+            getattr(observer, hook)(**kwargs)
+        getattr(signals, hook).send(sender=self.__class__, client=self,
+                                    **kwargs)
+
     def call(self, method, **params):
         """
         Call the DISQUS API and return the json response.
         URLError is raised when the request failed.
         DisqusException is raised when the query didn't succeed.
         """
-        url = self.api_url % method
-        request = self._get_request(url, self.METHODS[method], **params)
+        url, http_method = self._get_endpoint(method)
+        if self.cache is not None and self._is_cached(method):
+            key = self._get_cache_key(url, params)
+            message = self.cache.get(key, _MISSING)
+            if message is _MISSING:
+                message = self._call(method, url, http_method, params)
+                # Empty responses, like a thread that wasn't found, are
+                # likely to change and are not cached.
+                if message:
+                    self.cache.set(key, message)
+            return message
+        return self._call(method, url, http_method, params)
+
+    def _call(self, method, url, http_method, params):
+        """Send the request and return the json response."""
+        self._notify('pre_request', method=method, params=params)
+        start = time.time()
         try:
-            response = urlopen(request)
-        except URLError:
-            raise
-        else:
-            response_json = json.loads(response.read())
+            request = self._get_request(url, http_method, **params)
+            response = self._send(request, http_method)
+            body = response.read()
+            self._count_bytes(response)
+            response_json = (self.decoder or json_decoder)(body)
             if not response_json['succeeded']:
                 raise DisqusException(response_json['message'])
-            return response_json['message']
+        except Exception as e:
+            self._notify('request_error', method=method, params=params,
+                         error=e, elapsed=time.time() - start)
+            raise
+        self._notify('post_response', method=method, params=params,
+                     elapsed=time.time() - start,
+                     size=response.bytes_received)
+        return response_json['message']
+
+    def iter_call(self, method, **params):
+        """
+        Call the DISQUS API and yield the items of the json response's
+        message list while the response is being read. Responses are
+        never cached.
+        URLError is raised when the request failed.
+        DisqusException is raised when the query didn't succeed.
+        """
+        url, http_method = self._get_endpoint(method)
+        self._notify('pre_request', method=method, params=params)
+        start = time.time()
+        response = None
+        try:
+            request = self._get_request(url, http_method, **params)
+            response = self._send(request, http_method)
+            for item in iter_message(response):
+                yield item
+        except Exception as e:
+            self._notify('request_error', method=method, params=params,
+                         error=e, elapsed=time.time() - start)
+            raise
+        else:
+            self._notify('post_response', method=method, params=params,
+                         elapsed=time.time() - start,
+                         size=response.bytes_received)
+        finally:
+            if response is not None:
+                response.close()
+                self._count_bytes(response)
+
+    def call_batch(self, method, params_list):
+        """
+        Call `method` once for each dict of params in `params_list` and
+        return a list with the json response of each call, or the
+        DisqusException if it didn't succeed.
+
+        If the client has a `batch_url`, all calls are sent in a single
+        POST request with the `method` and the JSON encoded list of params
+        as `requests`. The endpoint has to respond with a list of
+        `{"succeeded": ..., "message": ...}` results in the same order.
+        Otherwise the calls are sent one by one.
+        """
+        if self.batch_url is None:
+            results = []
+            for params in params_list:
+                try:
+                    results.append(self.call(method, **params))
+                except DisqusException as e:
+                    results.append(e)
+            return results
+
+        defaults = self.default_params or {}
+        requests = [dict((key, force_text(value, strings_only=True))
+                         for key, value in dict(defaults, **params).items())
+                    for params in params_list]
+        message = self._call('batch:%s' % method, self.batch_url, 'POST', {
+            'method': method,
+            'requests': json.dumps(requests),
+        })
+        return [result['message'] if result['succeeded']
+                else DisqusException(result['message'])
+                for result in message]
+
+
+class Paginator(object):
+    """
+    Iterates over the pages of a DISQUS API list method such as
+    `get_forum_posts`, `get_thread_list` or `get_thread_posts`.
+
+    Pages of `per_page` entries are requested with the `start` and `limit`
+    parameters until the first empty page. With `prefetch` set, that many
+    of the following pages are fetched concurrently while a page is being
+    handled. They are fetched in `thread_pool` if it is given, so that one
+    pool can be shared between paginators, or else in a pool of their own.
+
+    Example:
+        >>> pages = Paginator(client, 'get_forum_posts', prefetch=4,
+        ...                   user_api_key=DISQUS_API_KEY, forum_id=forum_id)
+        >>> for page in pages:
+        ...     print(len(page))
+    """
+
+    def __init__(self, client, method, per_page=100, prefetch=0,
+                 thread_pool=None, **params):
+        self.client = client
+        self.method = method
+        self.per_page = per_page
+        self.prefetch = prefetch
+        self.thread_pool = thread_pool
+        self.params = params
+
+    def get_page(self, number):
+        """Return the page with the given (zero-based) number."""
+        return self.client.call(self.method,
+                                start=number * self.per_page,
+                                limit=self.per_page,
+                                **self.params)
+
+    def __iter__(self):
+        if not self.prefetch:
+            number = 0
+            while True:
+                page = self.get_page(number)
+                if not page:
+                    return
+                yield page
+                number += 1
+
+        pool = self.thread_pool or ThreadPool(self.prefetch)
+        pending = deque()
+        try:
+            for number in range(self.prefetch + 1):
+                pending.append(pool.apply_async(self.get_page, (number,)))
+            while True:
+                page = pending.popleft().get()
+                if not page:
+                    return
+                number += 1
+                pending.append(pool.apply_async(self.get_page, (number,)))
+                yield page
+        finally:
+            if self.thread_pool is None:
+                pool.close()
+                pool.join()
+
+
+class AsyncDisqusClient(DisqusClient):
+    """
+    Asyncio variant of the DisqusClient. API methods return awaitables and
+    the blocking requests are run in a thread pool, so at most
+    `max_concurrency` requests are in flight at once.
+
+    Example:
+        >>> client = AsyncDisqusClient(max_concurrency=10)
+        >>> forums = await client.get_forum_list(user_api_key=DISQUS_API_KEY)
+        >>> threads = await client.gather(
+        ...     ('get_thread_by_url', {'url': url, 'forum_api_key': key})
+        ...     for url in urls)
+    """
+    api_call = 'call_async'
+    max_concurrency = 10
+    loop = None
+
+    def __init__(self, **kwargs):
+        if asyncio is None:
+            raise RuntimeError("AsyncDisqusClient requires asyncio.")
+        super(AsyncDisqusClient, self).__init__(**kwargs)
+        if self.pool is None:
+            self.pool = ConnectionPool(maxsize=self.max_concurrency)
+        self._executor = ThreadPoolExecutor(self.max_concurrency)
+
+    def call_async(self, method, **params):
+        """Return an awaitable for `call(method, **params)`."""
+        loop = self.loop or asyncio.get_event_loop()
+        return loop.run_in_executor(
+            self._executor, functools.partial(self.call, method, **params))
+
+    def gather(self, calls, return_exceptions=False):
+        """
+        Issue many calls at once and return an awaitable for the list of
+        their responses, in order. `calls` is an iterable of
+        `(method, params)` tuples. No more than `max_concurrency` of them
+        are sent at the same time.
+        """
+        return asyncio.gather(
+            *[self.call_async(method, **params) for method, params in calls],
+            return_exceptions=return_exceptions)
+
+    def close(self):
+        """Shut down the thread pool and close pooled connections."""
+        self._executor.shutdown()
+        self.pool.close()
@@ -0,0 +1,510 @@
+"""
+An in-process stand-in for the DISQUS API, for testing and load testing
+the client and the management commands without touching DISQUS.
+
+Example:
+    >>> server = FakeApiServer(latency=0.05, error_rate=0.01, rate_limit=20)
+    >>> forum = server.store.add_forum('example')
+    >>> server.start()
+    >>> client = DisqusClient(api_url=server.api_url)
+    >>> client.get_forum_list(user_api_key=server.store.user_api_key)
+    >>> server.stop()
+"""
+import datetime
+import gzip
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from io import BytesIO
+try:
+    from inspect import getfullargspec as getargspec
+except ImportError:
+    # Python 2
+    from inspect import getargspec
+
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib.parse import parse_qs, urlsplit
+
+
+class FakeApiError(Exception):
+    """Raised by the store when a call doesn't succeed."""
+
+    def __init__(self, code, message):
+        super(FakeApiError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M')
+
+
+def _required_params(method):
+    """Return the names of the params `method` can't be called without."""
+    spec = getargspec(method)
+    return spec.args[1:len(spec.args) - len(spec.defaults or ())]
+
+
+def _page(items, start=0, limit=25, **params):
+    start = int(start)
+    return items[start:start + int(limit)]
+
+
+class FakeApiStore(object):
+    """
+    Thread-safe in-memory forums, threads and posts. There is a method for
+    each API method in `DisqusClient.METHODS`, which takes the same params
+    and returns the message of the response or raises `FakeApiError`.
+    """
+
+    def __init__(self, user_api_key='user-api-key', username='fake'):
+        self.user_api_key = user_api_key
+        self.username = username
+        self.forums = OrderedDict()
+        self.threads = OrderedDict()
+        self.posts = OrderedDict()
+        self._forum_api_keys = {}
+        self._forum_posts = defaultdict(list)
+        self._thread_posts = defaultdict(list)
+        self._ids = 0
+        self._lock = threading.RLock()
+
+    def _next_id(self):
+        self._ids += 1
+        return str(self._ids)
+
+    def _check_user(self, user_api_key):
+        if user_api_key != self.user_api_key:
+            raise FakeApiError('bad-key', 'Invalid user API key.')
+
+    def _get_forum(self, forum_api_key):
+        try:
+            return self.forums[self._forum_api_keys[forum_api_key]]
+        except KeyError:
+            raise FakeApiError('bad-key', 'Invalid forum API key.')
+
+    def _get_thread(self, forum, thread_id):
+        thread = self.threads.get(str(thread_id))
+        if thread is None or thread['forum'] != forum['id']:
+            raise FakeApiError('not-found', 'Thread not found.')
+        return thread
+
+    def _filter_posts(self, posts, filter=None, exclude=None, **params):
+        if filter:
+            posts = [p for p in posts if p['status'] in filter.split(',')]
+        if exclude:
+            posts = [p for p in posts if p['status'] not in exclude.split(',')]
+        return _page(posts, **params)
+
+    def add_forum(self, shortname, name=None):
+        """Add a forum and return it. Its API key is `<shortname>-key`."""
+        with self._lock:
+            forum = {
+                'id': self._next_id(),
+                'shortname': shortname,
+                'name': name or shortname,
+                'created_at': _now(),
+            }
+            self.forums[forum['id']] = forum
+            self._forum_api_keys['%s-key' % shortname] = forum['id']
+            return forum
+
+    def add_thread(self, forum, title, url='', identifier=None):
+        """Add a thread to `forum` and return it."""
+        with self._lock:
+            thread = {
+                'id': self._next_id(),
+                'forum': forum['id'],
+                'title': title,
+                'slug': title.lower().replace(' ', '_'),
+                'url': url,
+                'identifier': [identifier or title],
+                'allow_comments': True,
+                'created_at': _now(),
+                'updated_at': _now(),
+            }
+            self.threads[thread['id']] = thread
+            return thread
+
+    def add_post(self, thread, message, author_name='nobody',
+                 author_email='nobody@example.org', author_url='',
+                 created_at=None, parent_post=None, status='approved'):
+        """Add a post to `thread` and return it."""
+        with self._lock:
+            post = {
+                'id': self._next_id(),
+                'forum': thread['forum'],
+                'thread': thread,
+                'message': message,
+                'created_at': created_at or _now(),
+                'parent_post': parent_post,
+                'status': status,
+                'has_been_moderated': False,
+                'shown': status == 'approved',
+                'is_anonymous': True,
+                'anonymous_author': {
+                    'name': author_name,
+                    'email': author_email,
+                    'url': author_url,
+                },
+            }
+            self.posts[post['id']] = post
+            self._forum_posts[post['forum']].append(post)
+            self._thread_posts[thread['id']].append(post)
+            thread['updated_at'] = _now()
+            return post
+
+    def populate(self, shortname='example', threads=10, posts_per_thread=10):
+        """Add a forum with generated threads and posts and return it."""
+        forum = self.add_forum(shortname)
+        for i in range(threads):
+            thread = self.add_thread(forum, 'Thread %d' % i,
+                                     'http://example.org/%d/' % i)
+            for j in range(posts_per_thread):
+                self.add_post(thread, 'Post %d of thread %d' % (j, i))
+        return forum
+
+    def get_forum_api_key(self, user_api_key, forum_id, **params):
+        self._check_user(user_api_key)
+        with self._lock:
+            if str(forum_id) not in self.forums:
+                raise FakeApiError('not-found', 'Forum not found.')
+            return '%s-key' % self.forums[str(forum_id)]['shortname']
+
+    def get_forum_list(self, user_api_key, **params):
+        self._check_user(user_api_key)
+        with self._lock:
+            return list(self.forums.values())
+
+    def get_forum_posts(self, user_api_key, forum_id, **params):
+        self._check_user(user_api_key)
+        with self._lock:
+            return self._filter_posts(self._forum_posts[str(forum_id)],
+                                      **params)
+
+    def get_num_posts(self, thread_ids, forum_api_key=None, **params):
+        with self._lock:
+            posts = [(thread_id, self._thread_posts.get(thread_id, []))
+                     for thread_id in thread_ids.split(',')]
+            return dict((thread_id, [len([p for p in thread if p['shown']]),
+                                     len(thread)])
+                        for thread_id, thread in posts)
+
+    def get_thread_by_url(self, url, forum_api_key, **params):
+        with self._lock:
+            forum = self._get_forum(forum_api_key)
+            for thread in self.threads.values():
+                if thread['forum'] == forum['id'] and thread['url'] == url:
+                    return thread
+            return None
+
+    def get_thread_list(self, forum_api_key=None, user_api_key=None,
+                        forum_id=None, **params):
+        with self._lock:
+            if forum_api_key is not None:
+                forum_id = self._get_forum(forum_api_key)['id']
+            else:
+                self._check_user(user_api_key)
+            threads = [t for t in self.threads.values()
+                       if t['forum'] == str(forum_id)]
+            return _page(threads, **params)
+
+    def get_thread_posts(self, forum_api_key, thread_id, **params):
+        with self._lock:
+            thread = self._get_thread(self._get_forum(forum_api_key),
+                                      thread_id)
+            return self._filter_posts(self._thread_posts[thread['id']],
+                                      **params)
+
+    def get_updated_threads(self, forum_api_key, since, **params):
+        with self._lock:
+            forum = self._get_forum(forum_api_key)
+            return [t for t in self.threads.values()
+                    if t['forum'] == forum['id'] and t['updated_at'] >= since]
+
+    def get_user_name(self, user_api_key, **params):
+        self._check_user(user_api_key)
+        return self.username
+
+    def moderate_post(self, user_api_key, post_id, action, **params):
+        self._check_user(user_api_key)
+        statuses = {'spam': 'spam', 'approve': 'approved', 'kill': 'killed'}
+        if action not in statuses:
+            raise FakeApiError('bad-action', 'Unknown action.')
+        with self._lock:
+            post = self.posts.get(str(post_id))
+            if post is None:
+                raise FakeApiError('not-found', 'Post not found.')
+            post['status'] = statuses[action]
+            post['shown'] = action == 'approve'
+            post['has_been_moderated'] = True
+            return post
+
+    def create_post(self, forum_api_key, thread_id, message, author_name,
+                    author_email, author_url='', created_at=None,
+                    parent_post=None, **params):
+        with self._lock:
+            thread = self._get_thread(self._get_forum(forum_api_key),
+                                      thread_id)
+            return self.add_post(thread, message, author_name, author_email,
+                                 author_url, created_at, parent_post)
+
+    def thread_by_identifier(self, forum_api_key, identifier, title,
+                             **params):
+        with self._lock:
+            forum = self._get_forum(forum_api_key)
+            for thread in self.threads.values():
+                if (thread['forum'] == forum['id'] and
+                        identifier in thread['identifier']):
+                    return {'thread': thread, 'created': False}
+            thread = self.add_thread(forum, title, identifier=identifier)
+            return {'thread': thread, 'created': True}
+
+    def update_thread(self, forum_api_key, thread_id, title=None, slug=None,
+                      url=None, allow_comments=None, **params):
+        with self._lock:
+            thread = self._get_thread(self._get_forum(forum_api_key),
+                                      thread_id)
+            for key, value in (('title', title), ('slug', slug),
+                               ('url', url),
+                               ('allow_comments', allow_comments)):
+                if value is not None:
+                    thread[key] = value
+            thread['updated_at'] = _now()
+            return ''
+
+    def call(self, method, params):
+        """
+        Call `method` with `params` and return the JSON encoded response,
+        like the DISQUS API would.
+        """
+        if method not in METHODS:
+            response = {'succeeded': False, 'code': 'bad-method',
+                        'message': 'Unknown method: %s' % method}
+            return json.dumps(response)
+        missing = [name for name in _required_params(getattr(self, method))
+                   if name not in params]
+        if missing:
+            response = {'succeeded': False, 'code': 'missing-params',
+                        'message': 'Missing params: %s' % ', '.join(missing)}
+            return json.dumps(response)
+        try:
+            # Encode before the lock is released, the message may be
+            # changed by other calls.
+            with self._lock:
+                return json.dumps({'succeeded': True, 'code': 'ok',
+                                   'message': getattr(self, method)(**params)})
+        except FakeApiError as e:
+            response = {'succeeded': False, 'code': e.code,
+                        'message': e.message}
+        return json.dumps(response)
+
+
+# The API methods of DisqusClient.METHODS that the store implements
+METHODS = (
+    'create_post',
+    'get_forum_api_key',
+    'get_forum_list',
+    'get_forum_posts',
+    'get_num_posts',
+    'get_thread_by_url',
+    'get_thread_list',
+    'get_thread_posts',
+    'get_updated_threads',
+    'get_user_name',
+    'moderate_post',
+    'thread_by_identifier',
+    'update_thread',
+)
+
+
+REASONS = {
+    200: 'OK',
+    429: 'Too Many Requests',
+    503: 'Service Unavailable',
+}
+
+
+class FakeApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers requests to `/api/<method>/` with the server's store and
+    batches of calls to `/batch/`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # Idle connections are closed after the server's idle_timeout
+        self.timeout = self.server.idle_timeout
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # Send responses right away instead of waiting for the ACK of the
+        # previous packet, which the client delays.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_body(self, status, body, headers=()):
+        if (self.server.compress and
+                'gzip' in (self.headers.get('Accept-Encoding') or '')):
+            buf = BytesIO()
+            fp = gzip.GzipFile(fileobj=buf, mode='wb')
+            fp.write(body)
+            fp.close()
+            body = buf.getvalue()
+            headers += (('Content-Encoding', 'gzip'),)
+        self.send_response(status, REASONS[status])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond(self, params):
+        path = urlsplit(self.path).path.strip('/').split('/')
+        method = path[-1]
+        params = dict((key, values[-1]) for key, values in params.items())
+        params.pop('api_version', None)
+        status, headers = self.server.admit(method)
+        if status != 200:
+            self.send_body(status, json.dumps({
+                'succeeded': False, 'code': 'unavailable',
+                'message': REASONS[status],
+            }).encode('utf-8'), headers)
+            return
+        store = self.server.store
+        if path[0] == 'batch':
+            calls = json.loads(params.pop('requests'))
+            response = '{"succeeded": true, "code": "ok", "message": [%s]}' % (
+                ', '.join(store.call(params['method'], dict(
+                    (str(key), value) for key, value in call.items()))
+                    for call in calls))
+        else:
+            response = store.call(method, params)
+        self.send_body(200, response.encode('utf-8'))
+
+    def do_GET(self):
+        self.respond(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        self.respond(parse_qs(data.decode('utf-8')))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeApiServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A fake DISQUS API served over HTTP/1.1 from a background thread.
+
+    `latency` is the number of seconds every response is delayed, or a
+    callable that returns it. A share of `error_rate` requests, which can
+    be a callable too, is answered with 503 Service Unavailable and a
+    Retry-After header of `retry_after` seconds if it is set. Requests
+    beyond `rate_limit` per second are answered with 429 Too Many
+    Requests and a Retry-After header. Responses are gzip compressed if
+    the client accepts it and `compress` is set. Keep-alive connections
+    that are idle for more than `idle_timeout` seconds are closed by the
+    server.
+
+    The number of requests per method is counted in `requests`, the
+    number of connections in `connections`, and the injected errors in
+    `errors` and `throttled`.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store=None, latency=0, error_rate=0, rate_limit=None,
+                 compress=True, seed=None, address=('127.0.0.1', 0),
+                 retry_after=None, idle_timeout=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeApiHandler)
+        self.store = store or FakeApiStore()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.idle_timeout = idle_timeout
+        self.rate_limit = rate_limit
+        self.compress = compress
+        self.requests = defaultdict(int)
+        self.connections = 0
+        self.errors = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._tokens = float(rate_limit or 0)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def api_url(self):
+        return 'http://%s:%d/api/%%s/?api_version=1.1' % self.server_address
+
+    @property
+    def batch_url(self):
+        return 'http://%s:%d/batch/' % self.server_address
+
+    def admit(self, method):
+        """
+        Count a request of `method`, wait for the latency and return the
+        HTTP status and headers the request is answered with.
+        """
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        with self._lock:
+            self.requests[method] += 1
+            if self.rate_limit:
+                now = time.time()
+                self._tokens = min(self.rate_limit, self._tokens +
+                                   (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    self.throttled += 1
+                    retry_after = (1 - self._tokens) / self.rate_limit
+                    return 429, (('Retry-After',
+                                  str(int(retry_after) + 1)),)
+                self._tokens -= 1
+            error_rate = self.error_rate
+            if callable(error_rate):
+                error_rate = error_rate()
+            if error_rate and self._random.random() < error_rate:
+                self.errors += 1
+                if self.retry_after is not None:
+                    return 503, (('Retry-After', str(self.retry_after)),)
+                return 503, ()
+        return 200, ()
+
+    def handle_error(self, request, client_address):
+        # Clients that reset their connection are expected, and don't need
+        # a traceback.
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        socketserver.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+    def start(self):
+        """Serve requests from a daemon thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
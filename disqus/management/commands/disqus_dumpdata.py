@@ -1,11 +1,14 @@
-from __future__ import print_function
-
+from collections import OrderedDict
+import datetime
 import json
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
+import os.path
+import sys
 
 from django.core.management.base import NoArgsCommand, CommandError
 
-from disqus.api import DisqusClient
+from disqus.api import DisqusClient, Paginator
 
 
 class Command(NoArgsCommand):
@@ -16,17 +19,123 @@ class Command(NoArgsCommand):
             help='Type of entries that should be returned'),
         make_option('--exclude', default='', dest='exclude', type='str',
             help='Type of entries that should be excluded from the response'),
+        make_option('--format', default='json', dest='format',
+            choices=['json', 'jsonl'],
+            help='Output format: a JSON array (json) or one post per line '
+                 '(jsonl). jsonl is always streamed.'),
+        make_option('--stream', action='store_true', dest='stream',
+            default=False,
+            help='Write each page of posts as soon as it arrives'),
+        make_option('-o', '--output', default=None, dest='output',
+            help='Write the output to the given file instead of stdout'),
+        make_option('--prefetch', default=0, dest='prefetch', type='int',
+            help='Number of pages that are downloaded ahead concurrently'),
+        make_option('-s', '--state-file', default=None, dest='state_file',
+            help='Saves the time of the dump in the given file and only '
+                 'dumps threads that were updated since then if possible'),
+        make_option('--merge', default=None, dest='merge',
+            help='Merges the dumped posts into the given previous dump'),
     )
     help = 'Output DISQUS data in JSON format'
     requires_model_validation = False
 
+    def _get_posts(self, client, forum, filter_, exclude, prefetch=0,
+                   thread_pool=None):
+        """Return an iterator over the forum's posts, page by page."""
+        from django.conf import settings
+
+        return iter(Paginator(
+            client, 'get_forum_posts',
+            per_page=100,
+            prefetch=prefetch,
+            thread_pool=thread_pool,
+            user_api_key=settings.DISQUS_API_KEY,
+            forum_id=forum['id'],
+            filter=filter_,
+            exclude=exclude))
+
+    def _get_updated_posts(self, client, forum, since, filter_, exclude,
+                           prefetch=0, thread_pool=None):
+        """
+        Yield the posts of all threads that were updated since the given
+        time, page by page. The pages of every thread are prefetched in
+        the same `thread_pool`.
+        """
+        from django.conf import settings
+
+        forum_api_key = client.get_forum_api_key(
+            user_api_key=settings.DISQUS_API_KEY,
+            forum_id=forum['id'])
+        threads = client.get_updated_threads(forum_api_key=forum_api_key,
+                                             since=since)
+        for thread in threads:
+            for page in Paginator(client, 'get_thread_posts',
+                                  per_page=100,
+                                  prefetch=prefetch,
+                                  thread_pool=thread_pool,
+                                  forum_api_key=forum_api_key,
+                                  thread_id=thread['id'],
+                                  filter=filter_,
+                                  exclude=exclude):
+                yield page
+
+    def _merge(self, path, format_, pages):
+        """
+        Merge the pages of posts into the dump at `path`, replacing posts
+        with the same id. Returns the merged posts in pages of 100.
+        """
+        posts = OrderedDict()
+        with open(path) as fp:
+            if format_ == 'jsonl':
+                previous = [json.loads(line) for line in fp if line.strip()]
+            else:
+                previous = [post for page in json.load(fp) for post in page]
+        for post in previous:
+            posts[post['id']] = post
+        for page in pages:
+            for post in page:
+                posts[post['id']] = post
+        posts = list(posts.values())
+        return [posts[i:i + 100] for i in range(0, len(posts), 100)]
+
+    def _write_json(self, output, pages, indent):
+        """
+        Write the pages as a JSON array of pages, one page at a time.
+        """
+        output.write('[')
+        for i, page in enumerate(pages):
+            if i:
+                output.write(', ')
+            output.write(json.dumps(page, indent=indent))
+            output.flush()
+        output.write(']\n')
+
+    def _write_json_lines(self, output, pages):
+        """Write each post as a JSON object on its own line."""
+        for page in pages:
+            for post in page:
+                output.write(json.dumps(post))
+                output.write('\n')
+            output.flush()
+
     def handle(self, **options):
         from django.conf import settings
 
-        client = DisqusClient()
+        prefetch = options.get('prefetch') or 0
+        client = DisqusClient.from_settings(workers=prefetch + 1)
         indent = options.get('indent')
         filter_ = options.get('filter')
         exclude = options.get('exclude')
+        format_ = options.get('format') or 'json'
+        stream = options.get('stream')
+        path = options.get('output')
+        state_file = options.get('state_file')
+        merge = options.get('merge')
+        since = None
+        if state_file is not None and os.path.exists(state_file):
+            with open(state_file) as fp:
+                since = fp.read().strip()
+        started_at = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M')
 
         # Get a list of all forums for an API key. Each API key can have
         # multiple forums associated. This application only supports the one
@@ -39,21 +148,34 @@ class Command(NoArgsCommand):
             raise CommandError("Could not find forum. " +
                                "Please check your " +
                                "'DISQUS_WEBSITE_SHORTNAME' setting.")
-        posts = []
-        has_new_posts = True
-        start = 0
-        step = 100
-        while has_new_posts:
-            new_posts = client.get_forum_posts(
-                user_api_key=settings.DISQUS_API_KEY,
-                forum_id=forum['id'],
-                start=start,
-                limit=start+step,
-                filter=filter_,
-                exclude=exclude)
-            if not new_posts:
-                has_new_posts = False
+        thread_pool = ThreadPool(prefetch) if prefetch else None
+        output = None
+        try:
+            if since is None:
+                pages = self._get_posts(client, forum, filter_, exclude,
+                                        prefetch, thread_pool)
             else:
-                start += step
-                posts.append(new_posts)
-        print(json.dumps(posts, indent=indent))
+                pages = self._get_updated_posts(client, forum, since, filter_,
+                                                exclude, prefetch,
+                                                thread_pool)
+            if merge is not None and os.path.exists(merge):
+                pages = self._merge(merge, format_, pages)
+
+            output = open(path, 'w') if path else sys.stdout
+            if format_ == 'jsonl':
+                self._write_json_lines(output, pages)
+            elif stream:
+                self._write_json(output, pages, indent)
+            else:
+                output.write(json.dumps(list(pages), indent=indent))
+                output.write('\n')
+        finally:
+            if path and output is not None:
+                output.close()
+            if thread_pool is not None:
+                thread_pool.close()
+                thread_pool.join()
+
+        if state_file is not None:
+            with open(state_file, 'w') as fp:
+                fp.write(started_at)
@@ -1,20 +1,73 @@
 from __future__ import print_function
 
+from collections import deque, OrderedDict
+import functools
 import json
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
 import os.path
+import threading
 
 from django.conf import settings
 from django.contrib import comments
 from django.contrib.sites.models import Site
 from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection, reset_queries
 try:
     from django.utils.encoding import force_text
 except ImportError:
     # Django < 1.5
     from django.utils.encoding import force_unicode as force_text
 
-from disqus.api import DisqusClient
+from disqus.api import DisqusClient, DisqusException, MetricsCollector
+
+
+class ThreadCache(object):
+    """
+    Maps the content objects comments are attached to onto the ids of
+    their DISQUS threads, optionally persisted as JSON in `path`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._threads = {}
+        self._counted = set()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as fp:
+                self._threads = json.load(fp)
+
+    def __contains__(self, key):
+        return key in self._threads
+
+    def get(self, key):
+        """
+        Return the thread id for `key` or None. Only the first lookup of
+        each key is counted as a hit or miss.
+        """
+        with self._lock:
+            thread_id = self._threads.get(key)
+            if key not in self._counted:
+                self._counted.add(key)
+                if thread_id is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return thread_id
+
+    def set(self, key, thread_id):
+        with self._lock:
+            self._threads[key] = thread_id
+
+    def save(self):
+        """Write the cache to its file, if it has one."""
+        if self.path is None:
+            return
+        with self._lock:
+            with open(self.path, 'w') as fp:
+                json.dump(self._threads, fp)
 
 
 class Command(NoArgsCommand):
@@ -25,9 +78,28 @@ class Command(NoArgsCommand):
         make_option('-s', '--state-file', action="store", dest="state_file",
                     help="Saves the state of the export in the given file " +
                          "and auto-resumes from this file if possible."),
+        make_option('-w', '--workers', action="store", dest="workers",
+                    type='int', default=1,
+                    help="Number of comments that are exported " +
+                         "concurrently."),
+        make_option('-t', '--thread-cache', action="store",
+                    dest="thread_cache",
+                    help="Caches the DISQUS thread ids of content objects " +
+                         "in the given file and reuses them in later runs."),
+        make_option('-b', '--batch-size', action="store", dest="batch_size",
+                    type='int', default=1,
+                    help="Number of comments of a thread that are sent " +
+                         "in one request to DISQUS_API_BATCH_URL."),
+        make_option('-r', '--retries', action="store", dest="retries",
+                    type='int', default=0,
+                    help="Number of times a failed request is retried."),
+        make_option('--rate-limit', action="store", dest="rate_limit",
+                    type='float', default=None,
+                    help="Maximum number of requests per second."),
     )
     help = 'Export comments from contrib.comments to DISQUS'
     requires_model_validation = False
+    chunk_size = 1000
 
     def _get_comments_to_export(self, last_export_id=None):
         """Return comments which should be exported."""
@@ -39,34 +111,273 @@ class Command(NoArgsCommand):
         return qs
 
     def _get_last_state(self, state_file):
-        """Checks the given path for the last exported comment's id"""
-        state = None
+        """
+        Checks the given path for the last exported comment's id, up to
+        which all comments were exported, and the ids of the comments after
+        it that were exported too. Returns both as a tuple.
+        """
         fp = open(state_file)
         try:
-            state = int(fp.read())
-            print("Found previous state: %d" % (state,))
+            pks = [int(pk) for pk in fp.read().split()]
         finally:
             fp.close()
-        return state
+        if not pks:
+            return None, set()
+        print("Found previous state: %d" % (pks[0],))
+        return pks[0], set(pks[1:])
 
-    def _save_state(self, state_file, last_pk):
-        """Saves the last_pk into the given state_file"""
+    def _save_state(self, state_file, last_pk, exported=()):
+        """
+        Saves the last_pk into the given state_file, followed by the pks of
+        the comments after it that were exported already.
+        """
         fp = open(state_file, 'w+')
         try:
-            fp.write(str(last_pk))
+            fp.write(' '.join(str(pk) for pk in
+                              [last_pk] + sorted(exported)))
         finally:
             fp.close()
 
-    def handle(self, **options):
+    def _get_comment_data(self, current_site, comment):
+        """
+        Return everything needed to export the comment to DISQUS, so that
+        the export itself doesn't need to touch the database. The content
+        object is only fetched if its thread isn't cached yet.
+        """
+        key = '%s:%s' % (comment.content_type_id, comment.object_pk)
+        data = {'key': key}
+        if key not in self.thread_cache:
+            data['url'] = 'http://%s%s' % (
+                current_site.domain,
+                comment.content_object.get_absolute_url())
+            data['title'] = force_text(comment.content_object)
+        # name and email are optional in contrib.comments but required
+        # in DISQUS. If they are not set, dummy values will be used
+        data['post'] = {
+            'message': comment.comment.encode('utf-8'),
+            'author_name': comment.userinfo.get('name',
+                                                'nobody').encode('utf-8'),
+            'author_email': comment.userinfo.get('email',
+                                                 'nobody@example.org'),
+            'author_url': comment.userinfo.get('url', ''),
+            'created_at': comment.submit_date.strftime('%Y-%m-%dT%H:%M'),
+        }
+        return data
+
+    def _get_thread_id(self, client, forum_api_key, data):
+        """Return the id of the comment's DISQUS thread."""
+        thread_id = self.thread_cache.get(data['key'])
+        if thread_id is not None:
+            return thread_id
+
+        # Try to find a thread with the comments URL.
+        thread = client.get_thread_by_url(
+            url=data['url'],
+            forum_api_key=forum_api_key)
+
+        # if no thread with the URL could be found, we create a new one.
+        # to do this, we first need to create the thread and then
+        # update the thread with a URL.
+        if not thread:
+            thread = client.thread_by_identifier(
+                forum_api_key=forum_api_key,
+                identifier=data['title'],
+                title=data['title'],
+            )['thread']
+            client.update_thread(
+                forum_api_key=forum_api_key,
+                thread_id=thread['id'],
+                url=data['url'])
+
+        self.thread_cache.set(data['key'], thread['id'])
+        return thread['id']
+
+    def _export_batch(self, client, forum_api_key, batch):
+        """
+        Export a batch of comments of the same thread to DISQUS. Returns
+        a list with the DisqusException of each comment that couldn't be
+        exported, or None.
+        """
+        thread_id = self._get_thread_id(client, forum_api_key, batch[0])
+        posts = [dict(data['post'],
+                      forum_api_key=forum_api_key,
+                      thread_id=thread_id) for data in batch]
+        results = client.call_batch('create_post', posts)
+        return [r if isinstance(r, DisqusException) else None
+                for r in results]
+
+    def _get_batches(self, chunk, batch_size):
+        """
+        Split the `(comment, data)` tuples of a chunk into batches of at
+        most `batch_size` comments of the same thread. Without batching the
+        comments are kept in pk order.
+        """
+        if batch_size == 1:
+            return [[comment] for comment in chunk]
+        threads = OrderedDict()
+        for comment, data in chunk:
+            threads.setdefault(data['key'], []).append((comment, data))
+        batches = []
+        for comments in threads.values():
+            for i in range(0, len(comments), batch_size):
+                batches.append(comments[i:i + batch_size])
+        return batches
+
+    def _get_comment_chunks(self, comments, current_site, verbosity):
+        """
+        Yield lists of `(comment, data)` tuples in pk-ordered chunks of
+        `chunk_size` comments. Each chunk takes a constant number of
+        queries: one for the comments and their users and one per content
+        type for the content objects. With a verbosity of 2 the queries are
+        counted, on Django >= 1.6.
+        """
+        CaptureQueriesContext = None
+        if verbosity >= 2:
+            try:
+                from django.test.utils import CaptureQueriesContext
+            except ImportError:
+                # Django < 1.6
+                pass
+        comments = comments.select_related('user')\
+                .prefetch_related('content_object')
+        last_pk = None
+        query_count = 0
+        comment_count = 0
+        while True:
+            qs = comments
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            if CaptureQueriesContext is not None:
+                with CaptureQueriesContext(connection) as queries:
+                    chunk = [(c, self._get_comment_data(current_site, c))
+                             for c in qs[:self.chunk_size]]
+                query_count += len(queries)
+                comment_count += len(chunk)
+                reset_queries()
+                if chunk:
+                    print("%d queries per 1000 comments" % (
+                        query_count * 1000 // comment_count))
+            else:
+                chunk = [(c, self._get_comment_data(current_site, c))
+                         for c in qs[:self.chunk_size]]
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1][0].pk
+
+    def _export_comments(self, comments, client, forum_api_key, workers,
+                         batch_size, state_file, verbosity, last_pk=None,
+                         exported=()):
+        """
+        Export the comments chunk by chunk, using a pool of `workers`
+        threads. The threads of a chunk are resolved once before its posts
+        are created in batches of `batch_size` comments per thread.
+        Comments are prepared and checkpointed in pk order on the calling
+        thread, so the state file always holds the highest pk up to which
+        every comment was exported, followed by the pks of the comments
+        after it that were exported out of order. Those in `exported` are
+        skipped.
+        """
         current_site = Site.objects.get_current()
-        client = DisqusClient()
+        pool = ThreadPool(workers) if workers > 1 else None
+        pending = deque()
+        unfinished = deque()
+        finished = set(exported)
+        state = {'last_pk': last_pk}
+        errors = []
+        resolve = functools.partial(self._get_thread_id, client,
+                                    forum_api_key)
+        export = functools.partial(self._export_batch, client,
+                                   forum_api_key)
+
+        def checkpoint(pks, results):
+            for pk, error in zip(pks, results):
+                if error is None:
+                    finished.add(pk)
+                else:
+                    errors.append(error)
+            while unfinished and unfinished[0] in finished:
+                state['last_pk'] = unfinished.popleft()
+                finished.discard(state['last_pk'])
+            if state_file is None:
+                return
+            if state['last_pk'] is not None:
+                self._save_state(state_file, state['last_pk'],
+                                 [pk for pk in finished
+                                  if pk > state['last_pk']])
+            elif finished:
+                # Nothing was exported contiguously from the start yet
+                self._save_state(state_file, 0, finished)
+
+        try:
+            for chunk in self._get_comment_chunks(comments, current_site,
+                                                  verbosity):
+                chunk = [(comment, data) for comment, data in chunk
+                         if comment.pk not in finished]
+                if not chunk:
+                    continue
+                threads = OrderedDict()
+                for comment, data in chunk:
+                    if data['key'] not in self.thread_cache:
+                        threads.setdefault(data['key'], data)
+                if pool is None:
+                    for data in threads.values():
+                        resolve(data)
+                else:
+                    pool.map(resolve, threads.values())
+
+                unfinished.extend(comment.pk for comment, data in chunk)
+                for batch in self._get_batches(chunk, batch_size):
+                    if errors:
+                        break
+                    pks = []
+                    for comment, data in batch:
+                        if verbosity >= 1:
+                            print("Exporting comment '%s'" % comment)
+                        pks.append(comment.pk)
+                    batch = [data for comment, data in batch]
+                    if pool is None:
+                        checkpoint(pks, export(batch))
+                        continue
+                    pending.append((pks, pool.apply_async(export, (batch,))))
+                    while pending and (pending[0][1].ready() or
+                                       len(pending) >= workers * 2):
+                        pks, result = pending.popleft()
+                        # re-raises any other error of the export
+                        checkpoint(pks, result.get())
+                if errors:
+                    break
+            # comments that are already being exported are checkpointed
+            # before the first error is raised
+            while pending:
+                pks, result = pending.popleft()
+                checkpoint(pks, result.get())
+            if errors:
+                raise errors[0]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def handle(self, **options):
         verbosity = int(options.get('verbosity'))
         dry_run = bool(options.get('dry_run'))
         state_file = options.get('state_file')
+        workers = max(int(options.get('workers') or 1), 1)
+        batch_size = max(int(options.get('batch_size') or 1), 1)
+        self.thread_cache = ThreadCache(options.get('thread_cache'))
+        rate_limit = options.get('rate_limit')
+        if rate_limit is not None and rate_limit < 0:
+            raise CommandError("The rate limit can't be negative.")
+        metrics = MetricsCollector()
+        client = DisqusClient.from_settings(
+            workers=workers, rate_limit=rate_limit,
+            retries=options.get('retries') or 0, observers=[metrics])
         last_exported_id = None
+        exported = set()
 
         if state_file is not None and os.path.exists(state_file):
-            last_exported_id = self._get_last_state(state_file)
+            last_exported_id, exported = self._get_last_state(state_file)
 
         comments = self._get_comments_to_export(last_exported_id)
         comments_count = comments.count()
@@ -98,43 +409,23 @@ class Command(NoArgsCommand):
             user_api_key=settings.DISQUS_API_KEY,
             forum_id=forum['id'])
 
-        for comment in comments:
+        try:
+            self._export_comments(comments, client, forum_api_key, workers,
+                                  batch_size, state_file, verbosity,
+                                  last_exported_id, exported)
+        finally:
+            self.thread_cache.save()
             if verbosity >= 1:
-                print("Exporting comment '%s'" % comment)
-
-            # Try to find a thread with the comments URL.
-            url = 'http://%s%s' % (
-                current_site.domain,
-                comment.content_object.get_absolute_url())
-            thread = client.get_thread_by_url(
-                url=url,
-                forum_api_key=forum_api_key)
-
-            # if no thread with the URL could be found, we create a new one.
-            # to do this, we first need to create the thread and then
-            # update the thread with a URL.
-            if not thread:
-                thread = client.thread_by_identifier(
-                    forum_api_key=forum_api_key,
-                    identifier=force_text(comment.content_object),
-                    title=force_text(comment.content_object),
-                )['thread']
-                client.update_thread(
-                    forum_api_key=forum_api_key,
-                    thread_id=thread['id'],
-                    url=url)
-
-            # name and email are optional in contrib.comments but required
-            # in DISQUS. If they are not set, dummy values will be used
-            client.create_post(
-                forum_api_key=forum_api_key,
-                thread_id=thread['id'],
-                message=comment.comment.encode('utf-8'),
-                author_name=comment.userinfo.get('name',
-                                                 'nobody').encode('utf-8'),
-                author_email=comment.userinfo.get('email',
-                                                  'nobody@example.org'),
-                author_url=comment.userinfo.get('url', ''),
-                created_at=comment.submit_date.strftime('%Y-%m-%dT%H:%M'))
-            if state_file is not None:
-                self._save_state(state_file, comment.pk)
+                print("Thread cache: %d hit(s), %d miss(es)" % (
+                    self.thread_cache.hits, self.thread_cache.misses))
+                print("Retried %d request(s), throttled for %.1f second(s)" % (
+                    client.retry_count, client.throttled))
+            if verbosity >= 2:
+                for method, stats in sorted(metrics.as_dict().items()):
+                    print("%s: %d call(s), %d error(s), %d byte(s), "
+                          "p50 %.3fs, p95 %.3fs, p99 %.3fs" % (
+                              method, stats['calls'], stats['errors'],
+                              stats['bytes_received'],
+                              stats['latency']['p50'],
+                              stats['latency']['p95'],
+                              stats['latency']['p99']))
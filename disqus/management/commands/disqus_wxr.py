@@ -0,0 +1,247 @@
+from __future__ import print_function
+
+import json
+from multiprocessing import Pool
+from optparse import make_option
+import os
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connections
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    # Django < 1.7
+    from django.utils.module_loading import import_by_path as import_string
+
+
+def get_items(feed):
+    """
+    Return the exported items of `feed` in pk order, so that they can be
+    split into chunks by their pks.
+    """
+    items = feed.filter_items(feed._Feed__get_dynamic_attr('items', None))
+    if hasattr(items, 'model') and items.query.can_filter():
+        return items.order_by('pk')
+    return sorted(items, key=lambda item: item.pk)
+
+
+def get_chunk_bounds(items, max_items):
+    """
+    Return a `(lower, upper)` tuple of pks for each chunk of `max_items`
+    items. A chunk holds the items with a pk greater than `lower` (or all
+    if it is None) and up to `upper`, so the chunks stay the same when
+    items are added or removed between runs.
+    """
+    if hasattr(items, 'values_list'):
+        pks = list(items.values_list('pk', flat=True))
+    else:
+        pks = [item.pk for item in items]
+    return [(pks[start - 1] if start else None,
+             pks[min(start + max_items, len(pks)) - 1])
+            for start in range(0, len(pks), max_items)]
+
+
+def get_chunk_items(items, lower, upper):
+    """Return the `items` with a pk greater than `lower` and up to `upper`."""
+    if hasattr(items, 'filter'):
+        if lower is not None:
+            items = items.filter(pk__gt=lower)
+        return items.filter(pk__lte=upper)
+    return [item for item in items
+            if (lower is None or item.pk > lower) and item.pk <= upper]
+
+
+def get_chunk_path(output, chunk, part=0):
+    """Return the path of the `part`th file of chunk `chunk`."""
+    return '%s-%05d-%03d.xml' % (output, chunk, part)
+
+
+def export_chunk(feed_path, chunk, lower, upper, output, max_bytes=None,
+                 encoding='utf-8'):
+    """
+    Write the items of the feed class `feed_path` with a pk greater than
+    `lower` and up to `upper` to the files of chunk `chunk`. If a file
+    would grow beyond `max_bytes`, the following items are written to
+    another part. Files are written under a temporary name and renamed once
+    they are complete.
+
+    Returns the chunk and a list of `(path, items, bytes)` for each file.
+    """
+    feed = import_string(feed_path)()
+    items = get_chunk_items(get_items(feed), lower, upper)
+    # The items are filtered already
+    feed.items = lambda: items
+    feed.filter_items = lambda items: items
+    feedgen = feed.get_streaming_feed(None, None)
+    entries = feedgen.items
+    feedgen.items = ()
+    header, footer = list(feedgen.stream(encoding))
+    feedgen.items = entries
+    stream = feedgen.stream(encoding)
+    next(stream)
+
+    files = []
+    state = {'fp': None}
+
+    def open_part():
+        path = get_chunk_path(output, chunk, len(files))
+        state.update(fp=open(path + '.tmp', 'wb'), path=path,
+                     size=len(header), count=0)
+        state['fp'].write(header)
+
+    def close_part():
+        state['fp'].write(footer)
+        state['fp'].close()
+        os.rename(state['path'] + '.tmp', state['path'])
+        files.append((state['path'], state['count'],
+                      state['size'] + len(footer)))
+        state['fp'] = None
+
+    try:
+        data = None
+        for next_data in stream:
+            # The last chunk of the stream is the footer
+            if data is not None:
+                if (state['fp'] is not None and max_bytes and state['count']
+                        and state['size'] + len(data) + len(footer) >
+                        max_bytes):
+                    close_part()
+                if state['fp'] is None:
+                    open_part()
+                state['fp'].write(data)
+                state['size'] += len(data)
+                state['count'] += 1
+            data = next_data
+        if state['fp'] is None:
+            open_part()
+        close_part()
+    finally:
+        if state['fp'] is not None:
+            state['fp'].close()
+    return chunk, files
+
+
+def _export_chunk(args):
+    return export_chunk(*args)
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('-f', '--feed', action="store", dest="feed",
+                    help="Dotted path of the WXR feed class to export. " +
+                         "Defaults to the DISQUS_WXR_FEED setting."),
+        make_option('-o', '--output', action="store", dest="output",
+                    default='disqus-wxr',
+                    help="Prefix of the written files, which are named " +
+                         "<output>-<chunk>-<part>.xml."),
+        make_option('-i', '--max-items', action="store", dest="max_items",
+                    type='int', default=1000,
+                    help="Number of items that are written per chunk."),
+        make_option('-m', '--max-bytes', action="store", dest="max_bytes",
+                    type='int', default=None,
+                    help="Maximum size of a file in bytes. Chunks that " +
+                         "would be larger are split into several files."),
+        make_option('-s', '--state-file', action="store", dest="state_file",
+                    help="Saves the finished chunks in the given file " +
+                         "and skips them when the export is resumed."),
+        make_option('-w', '--workers', action="store", dest="workers",
+                    type='int', default=1,
+                    help="Number of processes that write chunks " +
+                         "concurrently."),
+    )
+    help = 'Export comments as a series of WXR files for importing them into DISQUS'
+    requires_model_validation = False
+
+    def _get_last_state(self, state_file, options):
+        """
+        Return the chunk bounds and the finished chunks saved in
+        `state_file`. The export has to be resumed with the same options.
+        """
+        with open(state_file) as fp:
+            state = json.load(fp)
+        for key in ('feed', 'output', 'max_items', 'max_bytes'):
+            if state.get(key) != options[key]:
+                raise CommandError(
+                    "The state file %s was written with a different "
+                    "--%s. Remove it to start a new export." % (
+                        state_file, key.replace('_', '-')))
+        return ([tuple(bounds) for bounds in state['bounds']],
+                dict((int(chunk), files)
+                     for chunk, files in state['chunks'].items()))
+
+    def _save_state(self, state_file, options, bounds, chunks):
+        """
+        Atomically saves the chunk bounds and the finished chunks into the
+        given state_file
+        """
+        state = dict(options, bounds=bounds, chunks=chunks)
+        with open(state_file + '.tmp', 'w') as fp:
+            json.dump(state, fp)
+        os.rename(state_file + '.tmp', state_file)
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity'))
+        state_file = options.get('state_file')
+        workers = max(int(options.get('workers') or 1), 1)
+        export_options = {
+            'feed': options.get('feed') or getattr(settings,
+                                                   'DISQUS_WXR_FEED', None),
+            'output': options.get('output') or 'disqus-wxr',
+            'max_items': max(int(options.get('max_items') or 1000), 1),
+            'max_bytes': options.get('max_bytes'),
+        }
+        if export_options['feed'] is None:
+            raise CommandError("No feed given. Please pass --feed or set " +
+                               "the 'DISQUS_WXR_FEED' setting.")
+        try:
+            feed = import_string(export_options['feed'])()
+        except ImportError as e:
+            raise CommandError("Could not import the feed: %s" % e)
+
+        finished = {}
+        if state_file is not None and os.path.exists(state_file):
+            bounds, finished = self._get_last_state(state_file,
+                                                    export_options)
+            if verbosity >= 1:
+                print("Found %d finished chunk(s)" % len(finished))
+        else:
+            # The chunks are fixed by their bounds for resumed exports
+            bounds = get_chunk_bounds(get_items(feed),
+                                      export_options['max_items'])
+
+        chunks = [
+            (export_options['feed'], chunk, lower, upper,
+             export_options['output'], export_options['max_bytes'])
+            for chunk, (lower, upper) in enumerate(bounds)
+            if chunk not in finished]
+        if verbosity >= 1:
+            print("Exporting %d chunk(s)" % len(chunks))
+
+        pool = None
+        if workers > 1 and len(chunks) > 1:
+            # The worker processes open their own database connections
+            for connection in connections.all():
+                connection.close()
+            pool = Pool(workers)
+            results = pool.imap_unordered(_export_chunk, chunks)
+        else:
+            results = (_export_chunk(args) for args in chunks)
+        try:
+            for chunk, files in results:
+                finished[chunk] = files
+                if state_file is not None:
+                    self._save_state(state_file, export_options, bounds,
+                                     finished)
+                if verbosity >= 1:
+                    for path, count, size in files:
+                        print("Wrote %d item(s), %d byte(s) to %s" % (
+                            count, size, path))
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
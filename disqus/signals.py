@@ -0,0 +1,12 @@
+from django.dispatch import Signal
+
+# Sent by DisqusClient before the request of an API method is sent.
+pre_request = Signal(providing_args=['client', 'method', 'params'])
+
+# Sent by DisqusClient after the response of an API method was read.
+post_response = Signal(providing_args=['client', 'method', 'params',
+                                       'elapsed', 'size'])
+
+# Sent by DisqusClient when the call of an API method failed.
+request_error = Signal(providing_args=['client', 'method', 'params',
+                                       'error', 'elapsed'])
@@ -3,23 +3,70 @@ import json
 import base64
 import hashlib
 import hmac
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import datetime
+import errno
+import gzip
+import zlib
+from multiprocessing.pool import ThreadPool
+from xml.dom import minidom
 
 from django.conf import settings
 if not settings.configured:
     settings.configure()
 
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.core.management.base import CommandError
 from django.test.utils import override_settings
+from django.utils.timezone import get_fixed_timezone
 from unittest import TestCase
 try:
     from unittest import mock
 except ImportError:
     import mock
 
-from disqus.api import DisqusClient, DisqusException
-from django.utils.six.moves.urllib.error import URLError
+from disqus.api import (
+    AsyncDisqusClient,
+    ConnectionPool,
+    DecompressingReader,
+    DisqusClient,
+    DisqusException,
+    DjangoCache,
+    LRUCache,
+    MetricsCollector,
+    NO_RESPONSE_ERRORS,
+    Observer,
+    Paginator,
+    PooledResponse,
+    RateLimiter,
+    iter_message,
+    asyncio
+)
+from django.utils.six import BytesIO, StringIO
+from django.utils.six.moves.urllib.error import HTTPError, URLError
 from django.utils.six.moves.urllib.parse import parse_qs, urlparse
+from django.utils.six.moves.urllib.request import Request, urlopen
 from django.template import Context, Template
+from disqus import call, signals
+from disqus.fakeapi import FakeApiServer, FakeApiStore
+from disqus.wxr_feed import (
+    BaseWxrFeed,
+    ContribCommentsWxrFeed,
+    FastWxrFeedType,
+    WxrComment,
+    WxrFeedType
+)
+from disqus.management.commands import (
+    disqus_dumpdata,
+    disqus_export,
+    disqus_wxr
+)
 from disqus.templatetags.disqus_tags import (
     set_disqus_developer,
     set_disqus_identifier,
@@ -34,8 +81,9 @@ from disqus.templatetags.disqus_tags import (
 
 class FakeRequest(object):
 
-    def __init__(self, path):
+    def __init__(self, path, GET=None):
         self.path = path
+        self.GET = GET or {}
 
 
 # mock Site
@@ -82,6 +130,156 @@ class FakeUrlopenNegative(mock.Mock):
         return '{"message":"message content","succeeded":false}'
 
 
+def start_fake_api(test, store=None, **kwargs):
+    """Start a FakeApiServer that is stopped once `test` is finished."""
+    server = FakeApiServer(store, **kwargs).start()
+    test.addCleanup(server.stop)
+    return server
+
+
+class FakeEntry(object):
+
+    def __init__(self, pk):
+        self.pk = pk
+
+    def get_absolute_url(self):
+        return '/entry/%s/' % self.pk
+
+    def __str__(self):
+        return 'Entry %s' % self.pk
+
+    __unicode__ = __str__
+
+
+class FakeComment(object):
+
+    def __init__(self, pk, content_object):
+        self.pk = pk
+        self.content_object = content_object
+        self.content_type_id = 1
+        self.object_pk = str(content_object.pk)
+        self.comment = 'Comment %s' % pk
+        self.userinfo = {'name': 'John', 'email': 'john@example.org'}
+        self.submit_date = datetime.datetime(2015, 3, 8, 12, 0)
+
+    def __str__(self):
+        return self.comment
+
+
+CONTEXT_PROCESSOR_CALLS = []
+
+
+def counting_context_processor(request):
+    CONTEXT_PROCESSOR_CALLS.append(request)
+    return {'processed': 'yes'}
+
+
+class CountingTemplate(Template):
+    """A template that counts how often it is rendered."""
+
+    renders = 0
+
+    def render(self, context):
+        self.renders += 1
+        return super(CountingTemplate, self).render(context)
+
+
+class FakeWxrFeed(BaseWxrFeed):
+    """A WXR feed of FakeEntry items with FakeComment comments."""
+
+    link = '/'
+    title = 'Entries'
+    description = 'All entries'
+
+    def __init__(self, entries=3, comments=2):
+        self.entries = [FakeEntry(i) for i in range(entries)]
+        self.comments = dict((entry.pk, [FakeComment(entry.pk * 10 + i, entry)
+                                         for i in range(comments)])
+                             for entry in self.entries)
+
+    def items(self):
+        return self.entries
+
+    def item_title(self, item):
+        return str(item)
+
+    def item_description(self, item):
+        return 'Description of %s & more' % item
+
+    def item_link(self, item):
+        return item.get_absolute_url()
+
+    def item_pubdate(self, item):
+        return datetime.datetime(2015, 3, 8, 12, item.pk)
+
+    def item_comments(self, item):
+        return self.comments[item.pk]
+
+    def comment_id(self, comment):
+        return comment.pk
+
+    def comment_user_name(self, comment):
+        return comment.userinfo['name']
+
+    def comment_user_email(self, comment):
+        return comment.userinfo['email']
+
+    def comment_submit_date(self, comment):
+        return comment.submit_date
+
+    def comment_comment(self, comment):
+        return comment.comment
+
+    comment_user_id = 0
+    comment_avatar = ''
+    comment_user_url = ''
+    comment_ip_address = '127.0.0.1'
+    comment_is_approved = 1
+    comment_parent = 0
+
+
+class FakeCommentQuerySet(list):
+
+    def count(self):
+        return len(self)
+
+    def filter(self, pk__gt):
+        return FakeCommentQuerySet(c for c in self if c.pk > pk__gt)
+
+    def select_related(self, *fields):
+        return self
+
+    def prefetch_related(self, *lookups):
+        return self
+
+
+class FakeDisqusApi(object):
+    """Stands in for `DisqusClient.call` and records the calls made."""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, **params):
+        with self.lock:
+            self.calls.append((method, params))
+        if method == 'get_forum_list':
+            return [{'id': '1', 'shortname': 'spam'}]
+        if method == 'get_forum_api_key':
+            return 'ham'
+        if method == 'get_thread_by_url':
+            return None
+        if method == 'thread_by_identifier':
+            return {'thread': {'id': params['identifier']}}
+        if method == 'create_post' and params['message'] in self.fail_on:
+            raise DisqusException('failed')
+        return {}
+
+    def count(self, method):
+        return len([c for c in self.calls if c[0] == method])
+
+
 class FakeAnonUser(mock.Mock):
 
     def is_anonymous(self):
@@ -595,9 +793,1731 @@ class DisqusClientTest(TestCase):
         with self.assertRaises(UnboundLocalError):
             self.client._get_request(url3, 'PUSH')
 
+    def test_call_method_without_pool_opens_a_connection_per_call(self):
+        server = start_fake_api(self)
+        client = DisqusClient(api_url=server.api_url)
+
+        for i in range(3):
+            self.assertEqual(
+                client.get_forum_list(user_api_key='user-api-key'), [])
+
+        self.assertEqual(server.connections, 3)
+
+    @override_settings(DISQUS_API_URL='http://example.org/api/%s/',
+                       DISQUS_API_BATCH_URL='http://example.org/batch/',
+                       DISQUS_API_CACHE='default', DISQUS_API_CACHE_TTL=60)
+    def test_client_from_settings(self):
+        client = DisqusClient.from_settings(workers=4, rate_limit=10,
+                                            retries=2)
+
+        self.assertEqual(client.api_url, 'http://example.org/api/%s/')
+        self.assertEqual(client.batch_url, 'http://example.org/batch/')
+        self.assertTrue(isinstance(client.cache, DjangoCache))
+        self.assertEqual(client.cache.ttl, 60)
+        self.assertEqual(client.cache_methods,
+                         ['get_forum_list', 'get_forum_api_key'])
+        self.assertEqual(client.pool.maxsize, 4)
+        self.assertEqual((client.rate_limiter.rate,
+                          client.rate_limiter.burst), (10, 4))
+        self.assertEqual(client.retries, 2)
+
+    def test_client_from_default_settings(self):
+        client = DisqusClient.from_settings(rate_limit=0)
+
+        self.assertEqual(client.api_url, DisqusClient.api_url)
+        self.assertEqual(client.batch_url, None)
+        self.assertEqual(client.cache, None)
+        self.assertEqual(client.rate_limiter, None)
+        self.assertEqual(client.pool.maxsize, 1)
+
     # XXX Don't know how to implement this and if should.
     def test_call_method_if_api_version_passed_as_method_argument(self):
         pass
 
+    def test_api_methods_are_generated_once_per_class(self):
+        for method, http_method in DisqusClient.METHODS.items():
+            api_method = DisqusClient.__dict__[method]
+            self.assertEqual(api_method.__name__, method)
+            self.assertTrue(http_method in api_method.__doc__)
+            self.assertEqual(getattr(self.client, method).__func__,
+                             getattr(DisqusClient(), method).__func__)
+
+    def test_methods_added_to_METHODS_later_are_callable(self):
+        client = DisqusClient(METHODS=dict(DisqusClient.METHODS,
+                                           get_categories_list='GET'))
+
+        with mock.patch.object(DisqusClient, 'call') as call_mock:
+            client.get_categories_list(forum_id=1)
+        call_mock.assert_called_with('get_categories_list', forum_id=1)
+
+    def test_urls_are_formatted_per_api_url(self):
+        self.assertEqual(self.client._get_endpoint('get_forum_list'),
+                         (self.client.api_url % 'get_forum_list', 'GET'))
+        self.client.api_url = 'http://localhost/api/%s/?api_version=1.1'
+        self.assertEqual(
+            self.client._get_endpoint('create_post'),
+            ('http://localhost/api/create_post/?api_version=1.1', 'POST'))
+
+    def test_default_params_are_sent_with_every_call(self):
+        client = DisqusClient(default_params={'forum_api_key': 'eggs'})
+
+        request = client._get_request(
+            *client._get_endpoint('get_thread_posts'), thread_id='1')
+        self.assertEqual(parse_qs(urlparse(request.get_full_url()).query),
+                         {'api_version': ['1.1'], 'forum_api_key': ['eggs'],
+                          'thread_id': ['1']})
+
+        request = client._get_request(
+            *client._get_endpoint('create_post'), message='spam')
+        self.assertEqual(parse_qs(request.data),
+                         {'forum_api_key': ['eggs'], 'message': ['spam']})
+
+        request = client._get_request(
+            *client._get_endpoint('create_post'), forum_api_key='ham')
+        self.assertEqual(parse_qs(request.data), {'forum_api_key': ['ham']})
+
+    def test_default_params_are_part_of_the_cache_key(self):
+        url = self.client.api_url % 'get_thread_list'
+        client = DisqusClient(default_params={'forum_api_key': 'eggs'})
+
+        self.assertNotEqual(client._get_cache_key(url, {}),
+                            self.client._get_cache_key(url, {}))
+        self.assertEqual(client._get_cache_key(url, {}),
+                         self.client._get_cache_key(
+                             url, {'forum_api_key': 'eggs'}))
+
+class ConnectionPoolTest(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_api(self)
+        forum = self.server.store.add_forum('spam')
+        self.forums = [forum]
+        self.thread = self.server.store.add_thread(forum, 'Spam')
+
+    def get_client(self, **kwargs):
+        pool = ConnectionPool(**kwargs)
+        self.addCleanup(pool.close)
+        return DisqusClient(api_url=self.server.api_url, pool=pool,
+                            default_params={'user_api_key': 'user-api-key',
+                                            'forum_api_key': 'spam-key'})
+
+    def create_post(self, client):
+        return client.create_post(thread_id=self.thread['id'],
+                                  message='ham', author_name='spam',
+                                  author_email='spam@example.org')
+
+    def test_connection_is_reused_across_calls(self):
+        client = self.get_client()
+
+        client.get_forum_list()
+        self.create_post(client)
+        client.get_num_posts(thread_ids=self.thread['id'])
+
+        self.assertEqual(self.server.connections, 1)
+
+    def test_connection_is_closed_after_max_requests(self):
+        client = self.get_client(max_requests=2)
+
+        for i in range(5):
+            client.get_forum_list()
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_idle_connection_is_not_reused_after_idle_timeout(self):
+        client = self.get_client(idle_timeout=0)
+
+        for i in range(3):
+            client.get_forum_list()
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_pool_is_shared_between_threads(self):
+        # Each thread returns its connection before taking one again, so
+        # no more than one connection per thread is opened.
+        client = self.get_client(maxsize=4)
+        errors = []
+
+        def worker():
+            try:
+                for i in range(10):
+                    client.get_forum_list()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(self.server.connections <= 4)
+
+    def close_idle_connections(self, client, error, method='getresponse'):
+        """Make the idle connections fail as if the server closed them."""
+        for connections in client.pool._idle.values():
+            for conn, last_used, request_count in connections:
+                setattr(conn, method, mock.Mock(side_effect=error))
+
+    def test_get_request_is_retried_on_closed_connection(self):
+        client = self.get_client()
+        client.get_forum_list()
+        self.close_idle_connections(
+            client, NO_RESPONSE_ERRORS[0]('No status line received'))
+
+        self.assertEqual(client.get_forum_list(), self.forums)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_get_request_is_not_retried_after_partial_response(self):
+        client = self.get_client()
+        client.get_forum_list()
+        self.close_idle_connections(client, socket.error('reset'))
+
+        with self.assertRaises(URLError):
+            client.get_forum_list()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_post_request_is_retried_on_closed_connection(self):
+        client = self.get_client()
+        client.get_forum_list()
+        self.close_idle_connections(
+            client, socket.error(errno.EPIPE, 'Broken pipe'), 'request')
+
+        self.create_post(client)
+
+        self.assertEqual(len(self.server.store.posts), 1)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_requests_are_retried_after_server_closed_idle_connection(self):
+        self.server.idle_timeout = 0.05
+        client = self.get_client()
+
+        for i in range(3):
+            self.create_post(client)
+            client.get_forum_list()
+            time.sleep(0.2)
+
+        self.assertEqual(len(self.server.store.posts), 3)
+        self.assertEqual(self.server.requests['create_post'], 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_error_status_raises_http_error(self):
+        client = self.get_client()
+        self.server.error_rate = 1
+
+        with self.assertRaises(HTTPError):
+            client.get_forum_list()
+
+    def test_connection_failure_raises_url_error(self):
+        client = self.get_client()
+        client.api_url = 'http://127.0.0.1:1/api/%s/?api_version=1.1'
+
+        with self.assertRaises(URLError):
+            client.get_forum_list()
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_api(self)
+        forum = self.server.store.add_forum('spam')
+        self.forums = [forum]
+        self.thread = self.server.store.add_thread(forum, 'Spam')
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(),
+                         {'hits': 3, 'misses': 1, 'evictions': 1})
+
+    def test_lru_cache_expires_after_ttl(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch('disqus.api.time.time', lambda: 1000):
+            cache.set('a', 1)
+        with mock.patch('disqus.api.time.time', lambda: 1009):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('disqus.api.time.time', lambda: 1010):
+            self.assertEqual(cache.get('a'), None)
+
+    def test_get_methods_are_cached(self):
+        client = DisqusClient(api_url=self.server.api_url, cache=LRUCache())
+
+        client.get_forum_list(user_api_key='user-api-key',
+                              developer_api_key='ham')
+        response = client.get_forum_list(developer_api_key='ham',
+                                          user_api_key='user-api-key')
+
+        self.assertEqual(response, self.forums)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(client.cache.stats(),
+                         {'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_post_methods_and_empty_responses_are_not_cached(self):
+        client = DisqusClient(api_url=self.server.api_url, cache=LRUCache(),
+                              default_params={'forum_api_key': 'spam-key'})
+
+        for i in range(2):
+            client.create_post(thread_id=self.thread['id'], message='spam',
+                               author_name='spam',
+                               author_email='spam@example.org')
+        client.get_thread_by_url(url='spam')
+        client.get_thread_by_url(url='spam')
+
+        self.assertEqual(self.server.connections, 4)
+
+    def test_cache_methods_limits_cached_methods(self):
+        client = DisqusClient(api_url=self.server.api_url, cache=LRUCache(),
+                              cache_methods=['get_forum_list'])
+
+        self.assertTrue(client._is_cached('get_forum_list'))
+        self.assertFalse(client._is_cached('get_forum_posts'))
+        self.assertFalse(client._is_cached('create_post'))
+
+    def test_django_cache(self):
+        cache = DjangoCache()
+
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', [1])
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.stats(),
+                         {'hits': 1, 'misses': 1, 'evictions': 0})
+
+
+class BatchCallTest(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_api(self)
+        forum = self.server.store.add_forum('spam')
+        self.thread = self.server.store.add_thread(forum, 'Spam')
+        self.client = DisqusClient(
+            api_url=self.server.api_url, batch_url=self.server.batch_url,
+            default_params={'forum_api_key': 'spam-key'})
+
+    def test_call_batch_sends_a_single_request(self):
+        post = {'thread_id': self.thread['id'], 'author_name': 'spam',
+                'author_email': 'spam@example.org'}
+        results = self.client.call_batch('create_post', [
+            dict(post, message='spam'),
+            dict(post, message='fail', thread_id='eggs'),
+            dict(post, message='ham')])
+
+        self.assertEqual(results[0]['message'], 'spam')
+        self.assertTrue(isinstance(results[1], DisqusException))
+        self.assertEqual(results[2]['message'], 'ham')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_call_batch_without_batch_url_sends_calls_one_by_one(self):
+        self.client.batch_url = None
+
+        results = self.client.call_batch('get_forum_list', [
+            {'user_api_key': 'user-api-key'}, {'user_api_key': 'spam'}])
+
+        self.assertEqual(len(results[0]), 1)
+        self.assertTrue(isinstance(results[1], DisqusException))
+        self.assertEqual(self.server.connections, 2)
+
+
+class ResponseDecodingTest(TestCase):
+
+    def setUp(self):
+        self.message = [
+            {'id': 1, 'message': u'Gr\xfc\xdfe', 'points': 12345},
+            {'id': 2, 'message': 'Thanks for the article!', 'points': -1.5},
+            [], None, 67890, 1.25e-10, True,
+        ]
+
+    def get_response(self, message, **fields):
+        fields.setdefault('succeeded', True)
+        fields['message'] = message
+        return BytesIO(json.dumps(fields, indent=2).encode('utf-8'))
+
+    def test_iter_message_yields_items(self):
+        for chunk_size in (1, 3, 65536):
+            response = self.get_response(self.message, code='ok')
+
+            items = list(iter_message(response, chunk_size=chunk_size))
+
+            self.assertEqual(items, self.message)
+
+    def test_iter_message_if_succeeded_comes_first(self):
+        response = BytesIO(b'{"succeeded": true, "message": [1, 2]}')
+
+        self.assertEqual(list(iter_message(response, chunk_size=2)), [1, 2])
+
+    def test_iter_message_with_empty_message(self):
+        response = self.get_response([])
+
+        self.assertEqual(list(iter_message(response)), [])
+
+    def test_iter_message_with_object_message(self):
+        for message in ({'id': 1, 'message': 'spam'}, 'spam', None):
+            response = self.get_response(message)
+
+            self.assertEqual(list(iter_message(response, chunk_size=3)),
+                             [message])
+
+    def test_iter_message_if_request_is_not_succeeded(self):
+        response = BytesIO(b'{"message":"message content","succeeded":false}')
+
+        with self.assertRaises(DisqusException):
+            list(iter_message(response))
+
+    def test_iter_message_with_truncated_response(self):
+        response = BytesIO(b'{"succeeded": true, "message": [1, 2')
+
+        with self.assertRaises(ValueError):
+            list(iter_message(response))
+
+    @mock.patch('disqus.api.urlopen', new_callable=FakeUrlopen)
+    def test_iter_call(self, urlopen_mock):
+        response = mock.Mock()
+        response.read = self.get_response(self.message).read
+        response.info.return_value = {}
+        urlopen_mock.return_value = response
+
+        items = DisqusClient().iter_call('get_forum_posts', forum_id='1')
+
+        self.assertEqual(list(items), self.message)
+        self.assertTrue(response.close.called)
+
+    @mock.patch('disqus.api.urlopen', new_callable=FakeUrlopen)
+    def test_custom_decoder(self, urlopen_mock):
+        decoder = mock.Mock(return_value={'succeeded': True, 'message': 1})
+        client = DisqusClient(decoder=decoder)
+
+        self.assertEqual(client.get_forum_list(), 1)
+        self.assertTrue(decoder.called)
+
+
+class CompressionTest(TestCase):
+
+    def setUp(self):
+        self.body = json.dumps({'message': ['spam'] * 1000,
+                                'succeeded': True}).encode('utf-8')
+
+    def get_response(self, body, encoding=None):
+        response = mock.Mock()
+        response.read = BytesIO(body).read
+        response.info.return_value = {'Content-Encoding': encoding}
+        return response
+
+    def test_gzip_response_is_decompressed_in_chunks(self):
+        fp = BytesIO()
+        with gzip.GzipFile(fileobj=fp, mode='wb') as gz:
+            gz.write(self.body)
+        reader = DecompressingReader(self.get_response(fp.getvalue(), 'gzip'))
+        reader.chunk_size = 16
+
+        data = b''
+        while True:
+            chunk = reader.read(100)
+            if not chunk:
+                break
+            data += chunk
+
+        self.assertEqual(data, self.body)
+        self.assertEqual(reader.bytes_received, len(fp.getvalue()))
+        self.assertEqual(reader.bytes_decoded, len(self.body))
+
+    def test_deflate_response_is_decompressed(self):
+        for compressed in (zlib.compress(self.body),
+                           zlib.compress(self.body)[2:-4]):
+            reader = DecompressingReader(
+                self.get_response(compressed, 'deflate'))
+
+            self.assertEqual(reader.read(), self.body)
+
+    def test_uncompressed_response(self):
+        reader = DecompressingReader(self.get_response(self.body))
+
+        self.assertEqual(reader.read(), self.body)
+        self.assertEqual(reader.bytes_received, reader.bytes_decoded)
+
+    def test_client_accepts_compressed_responses(self):
+        store = FakeApiStore()
+        store.populate('spam', threads=1, posts_per_thread=100)
+        thread_id = list(store.threads)[0]
+        server = start_fake_api(self, store)
+        for pool in (None, ConnectionPool()):
+            client = DisqusClient(api_url=server.api_url, pool=pool,
+                                  default_params={'forum_api_key': 'spam-key'})
+
+            posts = client.get_thread_posts(thread_id=thread_id, limit=100)
+            self.assertEqual(len(posts), 100)
+            size = client.bytes_decoded
+            self.assertTrue(client.bytes_received < size / 10)
+
+            client.compress = False
+            client.get_thread_posts(thread_id=thread_id, limit=100)
+            self.assertEqual(client.bytes_decoded, 2 * size)
+
+
+class RetryTest(TestCase):
+
+    def setUp(self):
+        # The first two requests fail with a 503 and a Retry-After
+        self.server = start_fake_api(
+            self, error_rate=lambda: 1 if self.server.errors < 2 else 0,
+            retry_after=2)
+
+    @mock.patch('disqus.api.time.sleep')
+    def test_retries_honor_retry_after(self, sleep_mock):
+        client = DisqusClient(api_url=self.server.api_url, retries=3)
+
+        self.assertEqual(client.get_forum_list(user_api_key='user-api-key'),
+                         [])
+        self.assertEqual(sleep_mock.call_args_list,
+                         [mock.call(2), mock.call(2)])
+        self.assertEqual(client.retry_count, 2)
+        self.assertEqual(client.throttled, 4)
+
+    @mock.patch('disqus.api.time.sleep')
+    def test_error_is_raised_after_last_retry(self, sleep_mock):
+        client = DisqusClient(api_url=self.server.api_url, retries=1)
+
+        with self.assertRaises(HTTPError):
+            client.create_post()
+        self.assertEqual(client.retry_count, 1)
+
+    def test_no_retries_by_default(self):
+        client = DisqusClient(api_url=self.server.api_url)
+
+        with self.assertRaises(HTTPError):
+            client.get_forum_list()
+
+    @mock.patch('disqus.api.time.sleep')
+    def test_backoff_grows_exponentially(self, sleep_mock):
+        client = DisqusClient(retries=5, backoff=1, max_backoff=6)
+        error = URLError('timed out')
+
+        delays = [client._get_retry_delay(i, error) for i in range(6)]
+
+        for delay, maximum in zip(delays, [1, 2, 4, 6, 6]):
+            self.assertTrue(maximum / 2.0 <= delay <= maximum)
+        self.assertEqual(delays[5], None)
+
+    def test_post_requests_are_only_retried_on_rejection(self):
+        client = DisqusClient(retries=3)
+        url = client.api_url % 'create_post'
+
+        for code, retried in [(429, True), (503, True), (500, False),
+                              (502, False), (504, False)]:
+            error = HTTPError(url, code, 'error', {}, BytesIO())
+            self.assertEqual(
+                client._get_retry_delay(0, error, 'POST') is not None,
+                retried)
+            self.assertNotEqual(client._get_retry_delay(0, error), None)
+
+    def test_post_requests_are_not_retried_on_connection_errors(self):
+        client = DisqusClient(retries=3,
+                              api_url='http://127.0.0.1:1/api/%s/')
+
+        with self.assertRaises(URLError):
+            client.create_post()
+        self.assertEqual(client.retry_count, 0)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=100, burst=2)
+        start = time.time()
+
+        waits = [limiter.acquire() for i in range(6)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertTrue(time.time() - start >= 0.035)
+        self.assertTrue(limiter.throttled >= 0.035)
+
+
+class PaginatorTest(TestCase):
+
+    def setUp(self):
+        self.client = DisqusClient()
+        self.entries = list(range(95))
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def api(self, method, **params):
+        with self.lock:
+            self.calls.append((method, params))
+        return self.entries[params['start']:params['start'] + params['limit']]
+
+    def test_pages_have_a_fixed_size(self):
+        with mock.patch.object(DisqusClient, 'call', side_effect=self.api):
+            pages = list(Paginator(self.client, 'get_thread_list',
+                                   per_page=10, forum_api_key='spam'))
+
+        self.assertEqual(pages, [self.entries[i:i + 10]
+                                 for i in range(0, 95, 10)])
+        self.assertEqual(self.calls[-1], (
+            'get_thread_list',
+            {'start': 100, 'limit': 10, 'forum_api_key': 'spam'}))
+        self.assertEqual(len(self.calls), 11)
+
+    def test_prefetch_returns_pages_in_order(self):
+        with mock.patch.object(DisqusClient, 'call', side_effect=self.api):
+            pages = list(Paginator(self.client, 'get_thread_list',
+                                   per_page=10, prefetch=4))
+
+        self.assertEqual(pages, [self.entries[i:i + 10]
+                                 for i in range(0, 95, 10)])
+        # requests for pages after the first empty one are never sent more
+        # than `prefetch` pages ahead
+        self.assertTrue(11 <= len(self.calls) <= 15)
+
+    def test_error_is_raised(self):
+        def api(method, **params):
+            if params['start'] == 20:
+                raise DisqusException('failed')
+            return self.api(method, **params)
+
+        with mock.patch.object(DisqusClient, 'call', side_effect=api):
+            pages = iter(Paginator(self.client, 'get_thread_list',
+                                   per_page=10, prefetch=2))
+            self.assertEqual(next(pages), self.entries[:10])
+            self.assertEqual(next(pages), self.entries[10:20])
+            with self.assertRaises(DisqusException):
+                next(pages)
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncDisqusClientTest(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_api(self)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.client = AsyncDisqusClient(api_url=self.server.api_url,
+                                        loop=self.loop, max_concurrency=3)
+        self.addCleanup(self.client.close)
+
+    def test_api_methods_return_awaitables(self):
+        future = self.client.get_forum_list(user_api_key='user-api-key')
+
+        self.assertEqual(self.loop.run_until_complete(future), [])
+
+    def test_unknown_attribute_raises_attribute_error(self):
+        with self.assertRaises(AttributeError):
+            self.client.baz
+
+    def test_gather_returns_responses_in_order(self):
+        calls = [('get_num_posts', {'forum_api_key': str(i)})
+                 for i in range(20)]
+
+        with mock.patch.object(DisqusClient, 'call',
+                               lambda self, method, **params: params):
+            responses = self.loop.run_until_complete(self.client.gather(calls))
+
+        self.assertEqual(responses, [params for method, params in calls])
+
+    def test_gather_is_bounded_by_max_concurrency(self):
+        calls = [('get_forum_list', {'user_api_key': 'user-api-key'})] * 20
+
+        responses = self.loop.run_until_complete(self.client.gather(calls))
+
+        self.assertEqual(responses, [[]] * 20)
+        self.assertTrue(self.server.connections <= 3)
+
+
+class DisqusExportCommandTest(TestCase):
+
+    def setUp(self):
+        self.real_sites_manager = Site.objects
+        Site.objects = FakeSiteManager('example.org', 'test')
+        self.tmpdir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.tmpdir, 'state')
+        entries = [FakeEntry(i) for i in range(3)]
+        self.comments = FakeCommentQuerySet(
+            FakeComment(pk, entries[pk % 3]) for pk in range(1, 21))
+
+    def tearDown(self):
+        Site.objects = self.real_sites_manager
+        shutil.rmtree(self.tmpdir)
+
+    def export(self, api, **options):
+        command = disqus_export.Command()
+        options.setdefault('verbosity', 0)
+        options.setdefault('state_file', self.state_file)
+        options.setdefault('thread_cache', None)
+        options.setdefault('batch_size', 1)
+        def get_comments(last_export_id):
+            if last_export_id is None:
+                return self.comments
+            return self.comments.filter(pk__gt=last_export_id)
+        with mock.patch.object(command, '_get_comments_to_export',
+                               get_comments):
+            with mock.patch.object(DisqusClient, 'call', side_effect=api):
+                with override_settings(DISQUS_API_KEY='spam',
+                                       DISQUS_WEBSITE_SHORTNAME='spam'):
+                    command.handle(**options)
+        return command
+
+    def test_export_creates_a_post_per_comment(self):
+        api = FakeDisqusApi()
+
+        self.export(api)
+
+        self.assertEqual(api.count('get_thread_by_url'), 3)
+        self.assertEqual(api.count('thread_by_identifier'), 3)
+        self.assertEqual(api.count('create_post'), 20)
+        self.assertEqual(
+            [p['message'] for m, p in api.calls if m == 'create_post'],
+            [c.comment.encode('utf-8') for c in self.comments])
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read(), '20')
+
+    def test_export_in_chunks(self):
+        api = FakeDisqusApi()
+
+        with mock.patch.object(disqus_export.Command, 'chunk_size', 3):
+            self.export(api)
+
+        self.assertEqual(
+            [p['message'] for m, p in api.calls if m == 'create_post'],
+            [c.comment.encode('utf-8') for c in self.comments])
+
+    def test_export_with_workers(self):
+        api = FakeDisqusApi()
+
+        self.export(api, workers=4)
+
+        self.assertEqual(api.count('get_thread_by_url'), 3)
+        self.assertEqual(api.count('create_post'), 20)
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read(), '20')
+
+    def test_export_with_verbosity_2(self):
+        api = FakeDisqusApi()
+
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            self.export(api, verbosity=2)
+
+        self.assertEqual(api.count('create_post'), 20)
+        self.assertTrue('queries per 1000 comments' in stdout.getvalue())
+
+    def test_export_without_rate_limit(self):
+        api = FakeDisqusApi()
+
+        self.export(api, rate_limit=0)
+
+        self.assertEqual(api.count('create_post'), 20)
+
+    def test_export_rejects_negative_rate_limit(self):
+        with self.assertRaises(CommandError):
+            self.export(FakeDisqusApi(), rate_limit=-1)
+
+    def test_export_with_workers_saves_contiguous_state_on_error(self):
+        api = FakeDisqusApi(fail_on=[b'Comment 7'])
+
+        with self.assertRaises(DisqusException):
+            self.export(api, workers=4)
+
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read().split()[0], '6')
+
+    def test_export_in_batches(self):
+        api = FakeDisqusApi()
+
+        with mock.patch.object(DisqusClient, 'call_batch',
+                               autospec=True,
+                               side_effect=DisqusClient.call_batch) as batch:
+            self.export(api, batch_size=4)
+
+        self.assertEqual(api.count('create_post'), 20)
+        self.assertEqual(batch.call_count, 6)
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read(), '20')
+
+    def get_posted(self, api):
+        return [p['message'] for m, p in api.calls if m == 'create_post']
+
+    def test_export_in_batches_saves_exported_comments_on_error(self):
+        api = FakeDisqusApi(fail_on=[b'Comment 7'])
+
+        with self.assertRaises(DisqusException):
+            self.export(api, batch_size=4)
+
+        # the first batch contains the comments 1, 4, 7 and 10 of the
+        # first thread, the export stops after it
+        self.assertEqual(api.count('create_post'), 4)
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read(), '1 4 10')
+
+    def test_resumed_export_in_batches_posts_each_comment_once(self):
+        api = FakeDisqusApi(fail_on=[b'Comment 7'])
+        with self.assertRaises(DisqusException):
+            self.export(api, batch_size=4)
+        posted = [m for m in self.get_posted(api) if m != b'Comment 7']
+        api = FakeDisqusApi()
+
+        self.export(api, batch_size=4)
+
+        posted += self.get_posted(api)
+        self.assertEqual(sorted(posted),
+                         sorted(c.comment.encode('utf-8')
+                                for c in self.comments))
+        with open(self.state_file) as fp:
+            self.assertEqual(fp.read(), '20')
+
+    def test_resumed_export_with_workers_posts_each_comment_once(self):
+        api = FakeDisqusApi(fail_on=[b'Comment 2'])
+        with self.assertRaises(DisqusException):
+            self.export(api, batch_size=4, workers=3)
+        posted = [m for m in self.get_posted(api) if m != b'Comment 2']
+        api = FakeDisqusApi()
+
+        self.export(api, batch_size=4, workers=3)
+
+        posted += self.get_posted(api)
+        self.assertEqual(sorted(posted),
+                         sorted(c.comment.encode('utf-8')
+                                for c in self.comments))
+
+    def test_export_reuses_thread_cache_file(self):
+        cache_file = os.path.join(self.tmpdir, 'threads.json')
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            self.export(FakeDisqusApi(), thread_cache=cache_file,
+                        state_file=None, verbosity=1, batch_size=5)
+        self.assertTrue('Thread cache: 0 hit(s), 3 miss(es)'
+                        in stdout.getvalue())
+        api = FakeDisqusApi()
+
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            self.export(api, thread_cache=cache_file, state_file=None,
+                        verbosity=1, batch_size=5)
+
+        self.assertTrue('Thread cache: 3 hit(s), 0 miss(es)'
+                        in stdout.getvalue())
+        self.assertEqual(api.count('get_thread_by_url'), 0)
+        self.assertEqual(api.count('create_post'), 20)
+        self.assertEqual(
+            set(p['thread_id'] for m, p in api.calls if m == 'create_post'),
+            set(['Entry 0', 'Entry 1', 'Entry 2']))
+
+    def test_thread_cache_counts_hits_and_misses(self):
+        cache = disqus_export.ThreadCache()
+
+        self.assertEqual(cache.get('1:1'), None)
+        cache.set('1:1', '42')
+        cache.set('1:2', '43')
+        self.assertEqual(cache.get('1:1'), '42')
+        self.assertEqual(cache.get('1:2'), '43')
+        self.assertEqual(cache.get('1:2'), '43')
+        self.assertTrue('1:1' in cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_export_counts_thread_cache_lookups_once_per_thread(self):
+        command = self.export(FakeDisqusApi(), batch_size=2)
+
+        self.assertEqual((command.thread_cache.hits,
+                          command.thread_cache.misses), (0, 3))
+
+
+class DisqusDumpdataCommandTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'dump.json')
+        self.posts = [{'id': str(i), 'message': 'Post %s' % i,
+                       'thread': str(i % 10)}
+                      for i in range(250)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def api(self, method, **params):
+        if method == 'get_forum_list':
+            return [{'id': '1', 'shortname': 'spam'}]
+        if method == 'get_forum_api_key':
+            return 'ham'
+        if method == 'get_updated_threads':
+            self.assertEqual(params, {'forum_api_key': 'ham',
+                                      'since': '2015-03-08T12:00'})
+            return [{'id': '1'}, {'id': '2'}]
+        if method == 'get_thread_posts':
+            posts = [p for p in self.posts if p['thread'] == params['thread_id']]
+        else:
+            posts = self.posts
+        return posts[params['start']:params['start'] + params['limit']]
+
+    def dump(self, **options):
+        options.setdefault('output', self.output)
+        with mock.patch.object(DisqusClient, 'call', side_effect=self.api):
+            with override_settings(DISQUS_API_KEY='spam',
+                                   DISQUS_WEBSITE_SHORTNAME='spam'):
+                disqus_dumpdata.Command().handle(**options)
+        with open(self.output) as fp:
+            return fp.read()
+
+    def test_dump_outputs_pages_of_posts(self):
+        output = self.dump()
+
+        self.assertEqual(json.loads(output),
+                         [self.posts[:100], self.posts[100:200],
+                          self.posts[200:]])
+
+    def test_streamed_dump_matches_dump(self):
+        self.assertEqual(json.loads(self.dump(stream=True)),
+                         json.loads(self.dump()))
+        self.assertEqual(json.loads(self.dump(stream=True, indent=2)),
+                         json.loads(self.dump()))
+
+    def test_dump_with_prefetch_matches_dump(self):
+        self.assertEqual(self.dump(prefetch=3), self.dump())
+
+    def test_dump_as_json_lines(self):
+        output = self.dump(format='jsonl')
+
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                         self.posts)
+
+    def test_dump_saves_state(self):
+        state_file = os.path.join(self.tmpdir, 'state')
+
+        self.dump(state_file=state_file)
+
+        with open(state_file) as fp:
+            datetime.datetime.strptime(fp.read(), '%Y-%m-%dT%H:%M')
+
+    def test_incremental_dump_merges_updated_threads(self):
+        state_file = os.path.join(self.tmpdir, 'state')
+        with open(state_file, 'w') as fp:
+            fp.write('2015-03-08T12:00')
+        previous = self.posts[:200]
+        with open(self.output, 'w') as fp:
+            json.dump([previous[:100], previous[100:]], fp)
+        self.posts[1] = dict(self.posts[1], message='Edited')
+
+        output = self.dump(state_file=state_file, merge=self.output,
+                           format='json')
+
+        posts = [post for page in json.loads(output) for post in page]
+        self.assertEqual(len(posts), 210)
+        self.assertEqual(posts[1]['message'], 'Edited')
+        self.assertEqual(posts[:200], previous[:1] + [self.posts[1]] +
+                         previous[2:])
+        self.assertEqual(posts[200:],
+                         [p for p in self.posts[200:] if p['thread'] == '1'] +
+                         [p for p in self.posts[200:] if p['thread'] == '2'])
+
+    def test_incremental_dump_prefetches_threads_in_one_pool(self):
+        state_file = os.path.join(self.tmpdir, 'state')
+        with open(state_file, 'w') as fp:
+            fp.write('2015-03-08T12:00')
+
+        with mock.patch.object(disqus_dumpdata, 'ThreadPool',
+                               wraps=ThreadPool) as command_pool:
+            with mock.patch('disqus.api.ThreadPool') as paginator_pool:
+                output = self.dump(state_file=state_file, prefetch=2,
+                                   format='jsonl')
+
+        command_pool.assert_called_once_with(2)
+        self.assertFalse(paginator_pool.called)
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                         [p for p in self.posts if p['thread'] == '1'] +
+                         [p for p in self.posts if p['thread'] == '2'])
+
+
+class RecordingObserver(Observer):
+    """Records the hooks it was called with."""
+
+    def __init__(self):
+        self.events = []
+
+    def pre_request(self, method, params):
+        self.events.append(('pre_request', method))
+
+    def post_response(self, method, params, elapsed, size):
+        self.events.append(('post_response', method, size))
+
+    def request_error(self, method, params, error, elapsed):
+        self.events.append(('request_error', method, type(error)))
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_api(self, compress=False)
+        self.metrics = MetricsCollector()
+        self.observer = RecordingObserver()
+        self.client = DisqusClient(
+            api_url=self.server.api_url,
+            default_params={'user_api_key': 'user-api-key'},
+            observers=[self.metrics, self.observer])
+        self.size = len(self.server.store.call(
+            'get_forum_list', {'user_api_key': 'user-api-key'}))
+
+    def test_observer_hooks(self):
+        size = self.size
+        self.client.get_forum_list()
+        self.server.error_rate = 1
+        with self.assertRaises(HTTPError):
+            self.client.create_post()
+
+        self.assertEqual(self.observer.events, [
+            ('pre_request', 'get_forum_list'),
+            ('post_response', 'get_forum_list', size),
+            ('pre_request', 'create_post'),
+            ('request_error', 'create_post', HTTPError),
+        ])
+
+    def test_iter_call_is_observed(self):
+        list(self.client.iter_call('get_forum_list'))
+
+        self.assertEqual(self.observer.events, [
+            ('pre_request', 'get_forum_list'),
+            ('post_response', 'get_forum_list', self.size),
+        ])
+
+    def test_collector_counts_calls_bytes_and_errors(self):
+        for i in range(3):
+            self.client.get_forum_list()
+        self.server.error_rate = 1
+        with self.assertRaises(HTTPError):
+            self.client.get_forum_list()
+
+        stats = self.metrics.as_dict()['get_forum_list']
+        self.assertEqual(stats['calls'], 4)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['error_rate'], 0.25)
+        self.assertEqual(stats['bytes_received'],
+                         3 * self.size)
+        self.assertTrue(stats['latency']['p50'] <= stats['latency']['max'])
+
+    def test_percentiles(self):
+        for i in range(100):
+            self.metrics.post_response('get_thread_posts', {},
+                                       0.01 if i < 90 else 2.0, 0)
+
+        latency = self.metrics.as_dict()['get_thread_posts']['latency']
+        self.assertTrue(0.01 <= latency['p50'] < 0.0125)
+        self.assertEqual(latency['p95'], 2.0)
+        self.assertEqual(latency['p99'], 2.0)
+        self.assertAlmostEqual(latency['mean'], 0.209)
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.as_dict(), {})
+
+    def test_signals_are_sent(self):
+        received = []
+
+        def receiver(signal, sender, client, method, **kwargs):
+            received.append((signal, sender, client, method))
+        signals.pre_request.connect(receiver)
+        signals.post_response.connect(receiver)
+        self.addCleanup(signals.pre_request.disconnect, receiver)
+        self.addCleanup(signals.post_response.disconnect, receiver)
+
+        self.client.get_forum_list()
+
+        self.assertEqual(received, [
+            (signals.pre_request, DisqusClient, self.client,
+             'get_forum_list'),
+            (signals.post_response, DisqusClient, self.client,
+             'get_forum_list'),
+        ])
+
+
+class FakeApiServerTest(TestCase):
+
+    def setUp(self):
+        self.store = FakeApiStore()
+        self.forum = self.store.populate('spam', threads=2,
+                                         posts_per_thread=250)
+        self.thread = list(self.store.threads.values())[0]
+
+    def start(self, **kwargs):
+        server = FakeApiServer(self.store, **kwargs).start()
+        self.addCleanup(server.stop)
+        client = DisqusClient(api_url=server.api_url, pool=ConnectionPool(),
+                              default_params={'forum_api_key': 'spam-key'})
+        self.addCleanup(client.pool.close)
+        return server, client
+
+    def test_forum_methods(self):
+        server, client = self.start()
+
+        forums = client.get_forum_list(user_api_key='user-api-key')
+        self.assertEqual([f['shortname'] for f in forums], ['spam'])
+        self.assertEqual(client.get_forum_api_key(user_api_key='user-api-key',
+                                                  forum_id=forums[0]['id']),
+                         'spam-key')
+        with self.assertRaises(DisqusException):
+            client.get_forum_list(user_api_key='eggs')
+        self.assertEqual(server.requests, {'get_forum_list': 2,
+                                           'get_forum_api_key': 1})
+
+    def test_pagination_over_keep_alive_connection(self):
+        server, client = self.start()
+
+        pages = list(Paginator(client, 'get_thread_posts',
+                               thread_id=self.thread['id']))
+
+        self.assertEqual([len(page) for page in pages], [100, 100, 50])
+        self.assertEqual(server.connections, 1)
+
+    def test_iter_call_streams_over_pooled_connection(self):
+        server, client = self.start(compress=False)
+        params = {'thread_id': self.thread['id'], 'limit': 250}
+        size = len(self.store.call('get_thread_posts', dict(
+            params, forum_api_key='spam-key')))
+        received = []
+        read = PooledResponse.read
+
+        def counting_read(response, *args):
+            data = read(response, *args)
+            received.append(len(data))
+            return data
+
+        with mock.patch.object(PooledResponse, 'read', counting_read):
+            posts = client.iter_call('get_thread_posts', **params)
+            next(posts)
+            self.assertTrue(0 < sum(received) < size)
+            self.assertEqual(len(list(posts)), 249)
+
+        self.assertEqual(sum(received), size)
+        client.get_thread_posts(**params)
+        self.assertEqual(server.connections, 1)
+
+    def test_threads_are_created_and_found_by_url(self):
+        server, client = self.start()
+        url = 'http://example.org/new/'
+
+        self.assertEqual(client.get_thread_by_url(url=url), None)
+        thread = client.thread_by_identifier(identifier='new',
+                                             title='New')['thread']
+        client.update_thread(thread_id=thread['id'], url=url)
+        post = client.create_post(thread_id=thread['id'], message='Hi',
+                                  author_name='spam',
+                                  author_email='spam@example.org')
+
+        self.assertEqual(client.get_thread_by_url(url=url)['id'],
+                         thread['id'])
+        self.assertEqual(client.get_thread_posts(thread_id=thread['id']),
+                         [post])
+        self.assertEqual(
+            client.get_num_posts(thread_ids=thread['id']),
+            {thread['id']: [1, 1]})
+
+    def test_batches(self):
+        server, client = self.start()
+        client.batch_url = server.batch_url
+
+        results = client.call_batch('create_post', [
+            {'thread_id': self.thread['id'], 'message': 'Hi',
+             'author_name': 'spam', 'author_email': 'spam@example.org'},
+            {'thread_id': 'eggs', 'message': 'Hi',
+             'author_name': 'spam', 'author_email': 'spam@example.org'},
+        ])
+
+        self.assertEqual(results[0]['message'], 'Hi')
+        self.assertTrue(isinstance(results[1], DisqusException))
+
+    def test_injected_latency_and_errors(self):
+        latencies = []
+        server, client = self.start(
+            latency=lambda: latencies.append(0.01) or 0.01, error_rate=1)
+
+        with self.assertRaises(HTTPError) as cm:
+            client.get_thread_list()
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(server.errors, 1)
+        self.assertEqual(latencies, [0.01])
+
+    def test_rate_limit(self):
+        server, client = self.start(rate_limit=1)
+
+        client.get_thread_list()
+        with self.assertRaises(HTTPError) as cm:
+            client.get_thread_list()
+        self.assertEqual(cm.exception.code, 429)
+        self.assertEqual(cm.exception.headers['Retry-After'], '1')
+        self.assertEqual(server.throttled, 1)
+
+    def test_responses_are_compressed(self):
+        server, client = self.start()
+
+        client.get_thread_posts(thread_id=self.thread['id'], limit=100)
+
+        self.assertTrue(client.bytes_received < client.bytes_decoded)
+
+    def test_missing_params(self):
+        response = json.loads(self.store.call('create_post', {
+            'forum_api_key': 'spam-key', 'message': 'Hi'}))
+
+        self.assertEqual(response['code'], 'missing-params')
+        self.assertEqual(response['message'], 'Missing params: thread_id, '
+                         'author_name, author_email')
+
+    def test_type_errors_of_methods_are_raised(self):
+        with self.assertRaises(TypeError):
+            self.store.call('get_thread_list', {'forum_api_key': 'spam-key',
+                                                'limit': None})
+
+    def legacy_call(self, server, method, data):
+        """
+        Call `method` with `disqus.call`, sent to `server` instead of DISQUS.
+        Returns the message and the Content-Encoding of the response.
+        """
+        encodings = []
+
+        def urlopen_server(request):
+            url = request.get_full_url().replace(
+                'http://disqus.com/api/', server.api_url.split('%s')[0])
+            response = urlopen(Request(url, request.data,
+                                       dict(request.header_items())))
+            encodings.append(response.info().get('Content-Encoding'))
+            return response
+
+        with mock.patch('disqus.urlopen', urlopen_server):
+            message = call(method, data, post=True)
+        return message, encodings[0]
+
+    def test_legacy_call_decodes_compressed_response(self):
+        server, client = self.start()
+
+        forums, encoding = self.legacy_call(
+            server, 'get_forum_list', {'user_api_key': 'user-api-key'})
+
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual([f['shortname'] for f in forums], ['spam'])
+
+    def test_legacy_call_reads_plain_response(self):
+        server, client = self.start(compress=False)
+
+        forums, encoding = self.legacy_call(
+            server, 'get_forum_list', {'user_api_key': 'user-api-key'})
+
+        self.assertEqual(encoding, None)
+        self.assertEqual([f['shortname'] for f in forums], ['spam'])
+
+    def test_dumpdata_command(self):
+        server = FakeApiServer(self.store).start()
+        self.addCleanup(server.stop)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        output = os.path.join(tmpdir, 'dump.jsonl')
+
+        with override_settings(DISQUS_API_URL=server.api_url,
+                               DISQUS_API_KEY='user-api-key',
+                               DISQUS_WEBSITE_SHORTNAME='spam'):
+            disqus_dumpdata.Command().handle(format='jsonl', output=output,
+                                             prefetch=2, filter='',
+                                             exclude='')
+
+        with open(output) as fp:
+            ids = [json.loads(line)['id'] for line in fp]
+        self.assertEqual(ids, list(self.store.posts))
+
+
+class WxrFeedTest(TestCase):
+
+    def setUp(self):
+        self.real_sites_manager = Site.objects
+        Site.objects = FakeSiteManager('example.org', 'Example')
+        self.feed = FakeWxrFeed()
+
+    def tearDown(self):
+        Site.objects = self.real_sites_manager
+
+    def get_feed(self):
+        output = BytesIO()
+        self.feed.get_feed(None, None).write(output, 'utf-8')
+        return output.getvalue()
+
+    def test_feed(self):
+        output = self.get_feed()
+
+        self.assertEqual(output.count(b'<item>'), 3)
+        self.assertEqual(output.count(b'<wp:comment>'), 6)
+        self.assertTrue(b'<title>Entry 1</title>' in output)
+        self.assertTrue(b'<link>http://example.org/entry/1/</link>'
+                        in output)
+        self.assertTrue(
+            b'<content:encoded>Description of Entry 1 &amp; more'
+            b'</content:encoded>' in output)
+        self.assertTrue(b'<wp:comment_id>11</wp:comment_id>' in output)
+        self.assertTrue(b'<wp:comment_parent>0</wp:comment_parent>'
+                        in output)
+
+    def test_streaming_feed_equals_feed(self):
+        chunks = list(self.feed.get_streaming_feed(None, None).stream('utf-8'))
+
+        # The header, one chunk per item and the footer
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(b''.join(chunks), self.get_feed())
+
+    def test_streaming_feed_is_lazy(self):
+        fetched = []
+        entries = self.feed.entries
+
+        def items():
+            for entry in entries:
+                fetched.append(entry.pk)
+                yield entry
+        self.feed.items = items
+        self.feed.comments_chunk_size = 2
+
+        stream = self.feed.get_streaming_feed(None, None).stream('utf-8')
+        next(stream)
+        self.assertEqual(fetched, [])
+        self.assertTrue(b'<title>Entry 0</title>' in next(stream))
+        # Items are fetched a chunk at a time
+        self.assertEqual(fetched, [0, 1])
+
+    def test_write_feed(self):
+        output = BytesIO()
+
+        self.feed.write_feed(output)
+
+        self.assertEqual(output.getvalue(), self.get_feed())
+
+    def test_prefetched_comments(self):
+        expected = self.get_feed()
+        chunks = []
+
+        def prefetch_comments(items):
+            chunks.append([item.pk for item in items])
+            return [self.feed.comments[item.pk] for item in items]
+        self.feed.prefetch_comments = prefetch_comments
+        self.feed.item_comments = None
+        self.feed.comments_chunk_size = 2
+
+        self.assertEqual(self.get_feed(), expected)
+        self.assertEqual(chunks, [[0, 1], [2]])
+
+    def test_contrib_comments_are_not_prefetched_if_overridden(self):
+        class EntryWxrFeed(ContribCommentsWxrFeed):
+            def item_comments(self, item):
+                return []
+
+        self.assertEqual(
+            EntryWxrFeed().prefetch_comments([FakeEntry(1)]), None)
+
+    def test_comments(self):
+        comments = self.feed._get_comments(self.feed.entries[1])
+
+        self.assertEqual(len(comments), 2)
+        self.assertTrue(isinstance(comments[0], WxrComment))
+        self.assertEqual(comments[0].id, '10')
+        self.assertEqual(comments[0]['user_name'], 'John')
+        self.assertEqual(comments[0]['is_approved'], '1')
+        self.assertEqual(comments[0].get('spam', 'eggs'), 'eggs')
+        self.assertRaises(KeyError, lambda: comments[0]['spam'])
+
+    def test_accessors(self):
+        class Callable(object):
+            def __call__(self):
+                return 'called'
+
+        self.feed.constant = 'spam'
+        self.feed.no_argument = lambda: 'eggs'
+        self.feed.instance = Callable()
+
+        self.assertEqual(self.feed._get_accessor('item_title')(
+            self.feed.entries[1]), 'Entry 1')
+        self.assertEqual(self.feed._get_accessor('constant')(None), 'spam')
+        self.assertEqual(self.feed._get_accessor('no_argument')(None), 'eggs')
+        self.assertEqual(self.feed._get_accessor('instance')(None), 'called')
+        self.assertEqual(self.feed._get_accessor('missing', 'ham')(None),
+                         'ham')
+
+    def test_attributes_are_looked_up_once(self):
+        lookups = []
+
+        class CountingWxrFeed(FakeWxrFeed):
+            def __getattribute__(self, name):
+                if name.startswith('comment_'):
+                    lookups.append(name)
+                return super(CountingWxrFeed, self).__getattribute__(name)
+        self.feed = CountingWxrFeed(comments=5)
+
+        self.get_feed()
+
+        self.assertEqual(len(lookups), 11)
+
+    def use_template(self, source):
+        tmp = CountingTemplate(source)
+        self.feed.title_template = 'title.html'
+        patcher = mock.patch('disqus.wxr_feed.template.loader.get_template',
+                             lambda name: tmp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return tmp
+
+    def test_title_template(self):
+        self.use_template('{{ obj }} on {{ site.domain }}')
+
+        output = self.get_feed()
+
+        self.assertTrue(b'<title>Entry 1 on example.org</title>' in output)
+        self.assertFalse(b'<title>Entry 1</title>' in output)
+
+    @override_settings(TEMPLATE_CONTEXT_PROCESSORS=(
+        'disqus.tests.counting_context_processor',))
+    def test_context_processors_run_once(self):
+        self.use_template('{{ obj }} {{ processed }}')
+        del CONTEXT_PROCESSOR_CALLS[:]
+
+        response = self.feed(FakeRequest('/feed/'))
+
+        self.assertTrue(b'<title>Entry 1 yes</title>' in response.content)
+        self.assertEqual(len(CONTEXT_PROCESSOR_CALLS), 1)
+
+    def test_fragment_cache(self):
+        modified = dict((pk, datetime.datetime(2015, 3, 8))
+                        for pk in range(3))
+
+        class ModifiedWxrFeed(FakeWxrFeed):
+            fragment_cache = LRUCache()
+
+            def item_modified(self, item):
+                return modified[item.pk]
+        self.feed = ModifiedWxrFeed()
+        tmp = self.use_template('{{ obj }}')
+
+        output = self.get_feed()
+        self.assertEqual(tmp.renders, 3)
+        self.assertEqual(self.get_feed(), output)
+        self.assertEqual(tmp.renders, 3)
+        modified[1] = datetime.datetime(2015, 3, 9)
+        self.assertEqual(self.get_feed(), output)
+        self.assertEqual(tmp.renders, 4)
+
+    def test_fragments_are_not_cached_without_modification_time(self):
+        tmp = self.use_template('{{ obj }}')
+        self.feed.fragment_cache = LRUCache()
+
+        self.get_feed()
+        self.get_feed()
+
+        self.assertEqual(tmp.renders, 6)
+
+    def get_fast_feed(self, feed_type=FastWxrFeedType):
+        output = BytesIO()
+        self.feed.feed_type = feed_type
+        self.feed.get_feed(None, None).write(output, 'utf-8')
+        return output.getvalue()
+
+    def test_fast_feed_equals_feed(self):
+        comments = self.feed.comments[1]
+        comments[0].comment = u'<b>Caf\xe9</b> & \u2603 >\n\tnew line'
+        comments[0].userinfo = {'name': b'bytes', 'email': None}
+        comments[1].submit_date = datetime.datetime(2015, 3, 8, 12, 0, 1, 5,
+                                                    tzinfo=get_fixed_timezone(60))
+        expected = self.get_feed()
+
+        self.assertEqual(self.get_fast_feed(), expected)
+        self.assertTrue(u'<wp:comment_content>&lt;b&gt;Caf\xe9&lt;/b&gt; '
+                        u'&amp; \u2603 &gt;\n\tnew line'
+                        u'</wp:comment_content>'.encode('utf-8') in expected)
+
+    def test_fast_feed_with_single_signon(self):
+        with mock.patch('disqus.wxr_feed.USE_SINGLE_SIGNON', True):
+            self.feed.comment_user_id = '7'
+            expected = self.get_feed()
+
+            self.assertEqual(self.get_fast_feed(), expected)
+            self.assertTrue(b'<dsq:remote><dsq:id>7</dsq:id>' in expected)
+
+    def test_fast_feed_uses_overridden_elements(self):
+        class NoAuthorsFeedType(FastWxrFeedType):
+            def add_comment_elements(self, handler, comment):
+                handler.addQuickElement('wp:comment_id', comment['id'])
+
+        output = self.get_fast_feed(NoAuthorsFeedType)
+
+        self.assertFalse(b'<wp:comment_author>' in output)
+        self.assertTrue(b'<wp:comment><wp:comment_id>10</wp:comment_id>'
+                        b'</wp:comment>' in output)
+
+    def test_fast_feed_streams(self):
+        self.feed.feed_type = FastWxrFeedType
+        chunks = list(self.feed.get_streaming_feed(None, None).stream('utf-8'))
+
+        self.assertEqual(len(chunks), 5)
+        self.feed.feed_type = WxrFeedType
+        self.assertEqual(b''.join(chunks), self.get_feed())
+
+    def test_since_from_query_string(self):
+        feed = ContribCommentsWxrFeed()
+        with mock.patch.object(BaseWxrFeed, '__call__', autospec=True,
+                               side_effect=lambda feed, request: feed.since):
+            since = feed(FakeRequest('/feed/', {'since': '2015-03-08T12:30'}))
+            self.assertEqual(since, datetime.datetime(2015, 3, 8, 12, 30))
+            since = feed(FakeRequest('/feed/', {'since': '2015-03-08'}))
+            self.assertEqual(since, datetime.datetime(2015, 3, 8))
+            # The since of a request isn't kept by the shared feed
+            self.assertEqual(feed.since, None)
+            self.assertEqual(feed(FakeRequest('/feed/')), None)
+
+    def test_invalid_since(self):
+        response = ContribCommentsWxrFeed()(
+            FakeRequest('/feed/', {'since': 'yesterday'}))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_items_without_comments_since_are_filtered(self):
+        from django.contrib.comments.models import Comment
+
+        since = datetime.datetime(2015, 3, 8)
+        feed = ContribCommentsWxrFeed(since=since)
+        with mock.patch.object(Comment, 'objects') as objects:
+            objects.filter.return_value.values_list.return_value\
+                .distinct.return_value = [(1, '0'), (1, '2'), (2, '1')]
+            with mock.patch.object(ContentType, 'objects') as ctypes:
+                ctypes.get_for_model.return_value = mock.Mock(pk=1)
+                items = list(feed.filter_items(
+                    FakeEntry(pk) for pk in range(3)))
+
+        objects.filter.assert_called_once_with(submit_date__gt=since)
+        self.assertEqual([item.pk for item in items], [0, 2])
+
+    def test_items_are_filtered_with_a_subquery(self):
+        from django.contrib.comments.models import Comment
+        from disqus.wxr_feed import Cast
+
+        since = datetime.datetime(2015, 3, 8)
+        items = mock.Mock(db='default')
+        items.model._meta.pk.get_internal_type.return_value = 'AutoField'
+        with mock.patch.object(Comment, 'objects') as objects:
+            with mock.patch.object(ContentType, 'objects') as ctypes:
+                filtered = ContribCommentsWxrFeed(since).filter_items(items)
+
+        comments = objects.filter.return_value.filter.return_value
+        comments.values_list.assert_not_called()
+        if Cast is not None:
+            object_pks = comments.annotate.return_value.values.return_value
+        else:
+            object_pks = comments.values.return_value
+        items.filter.assert_called_once_with(pk__in=object_pks)
+        self.assertEqual(filtered, items.filter.return_value)
+
+    @override_settings(USE_TZ=False, TIME_ZONE='UTC')
+    def test_aware_since_without_time_zone_support(self):
+        since = datetime.datetime(2015, 3, 8, 12, 30,
+                                  tzinfo=get_fixed_timezone(60))
+
+        self.assertEqual(ContribCommentsWxrFeed(since).get_since(),
+                         datetime.datetime(2015, 3, 8, 11, 30))
+
+    @override_settings(USE_TZ=True, TIME_ZONE='UTC')
+    def test_naive_since_with_time_zone_support(self):
+        since = datetime.datetime(2015, 3, 8, 12, 30)
+
+        self.assertEqual(ContribCommentsWxrFeed(since).get_since(),
+                         datetime.datetime(2015, 3, 8, 12, 30,
+                                           tzinfo=get_fixed_timezone(0)))
+
+    def test_comments_since(self):
+        from django.contrib.comments.models import Comment
+
+        since = datetime.datetime(2015, 3, 8)
+        with mock.patch.object(Comment, 'objects') as objects:
+            with mock.patch.object(ContentType, 'objects') as ctypes:
+                ctype = ctypes.get_for_model.return_value
+                comments = ContribCommentsWxrFeed(since).item_comments(
+                    FakeEntry(1))
+                all_comments = ContribCommentsWxrFeed().item_comments(
+                    FakeEntry(1))
+
+        objects.filter.assert_called_with(content_type=ctype, object_pk=1)
+        self.assertEqual(all_comments, objects.filter.return_value)
+        self.assertEqual(comments,
+                         objects.filter.return_value.filter.return_value)
+        objects.filter.return_value.filter.assert_called_once_with(
+            submit_date__gt=since)
+
+    def make_comments(self, parents):
+        return [WxrComment('', '', str(pk), '', '', '', '', None, '', '1',
+                           parent) for pk, parent in parents]
+
+    def test_thread_comments(self):
+        comments = self.make_comments([
+            (1, '0'), (2, '3'), (3, '0'), (4, '2'), (5, '99'), (6, '7'),
+            (7, '6')])
+
+        comments = self.feed._thread_comments(comments)
+
+        self.assertEqual([(c.id, c.parent) for c in comments], [
+            ('1', '0'), ('3', '0'), ('2', '3'), ('4', '2'), ('5', '0'),
+            ('6', '0'), ('7', '6')])
+
+    def test_thread_comments_only_detaches_cycle_edge(self):
+        comments = self.make_comments([
+            (1, '0'), (5, '3'), (2, '4'), (3, '2'), (4, '3')])
+
+        comments = self.feed._thread_comments(comments)
+
+        self.assertEqual([(c.id, c.parent) for c in comments], [
+            ('1', '0'), ('3', '0'), ('5', '3'), ('4', '3'), ('2', '4')])
+
+    def test_thread_comments_keeps_missing_parents(self):
+        comments = self.make_comments([(1, '0'), (2, '99')])
+
+        comments = self.feed._thread_comments(comments, keep_missing=True)
+
+        self.assertEqual([(c.id, c.parent) for c in comments],
+                         [('1', '0'), ('2', '99')])
+
+    def test_threaded_feed(self):
+        class ThreadedWxrFeed(FakeWxrFeed):
+            threaded = True
+
+            def comment_parent(self, comment):
+                return getattr(comment, 'parent_id', 0)
+        self.feed = ThreadedWxrFeed()
+        self.feed.comments[1][0].parent_id = 11
+
+        output = self.get_feed()
+
+        self.assertTrue(b'<wp:comment_id>11</wp:comment_id>' in output)
+        self.assertTrue(output.index(b'<wp:comment_id>11</wp:comment_id>') <
+                        output.index(b'<wp:comment_id>10</wp:comment_id>'))
+        self.assertEqual(output.count(b'<wp:comment_parent>11'), 1)
+        self.assertEqual(output.count(b'<wp:comment_parent>0'), 5)
+
+    def test_contrib_comment_parent(self):
+        feed = ContribCommentsWxrFeed()
+        comment = FakeComment(2, FakeEntry(1))
+
+        self.assertEqual(feed.comment_parent(comment), 0)
+        comment.parent_id = 1
+        self.assertEqual(feed.comment_parent(comment), 1)
+        self.assertEqual(feed._thread_comments(
+            self.make_comments([(2, '1')]))[0].parent, '0')
+        feed.since = datetime.datetime(2015, 3, 8)
+        self.assertEqual(feed._thread_comments(
+            self.make_comments([(2, '1')]))[0].parent, '1')
+
+    def test_streaming_response(self):
+        self.feed.stream = True
+
+        response = self.feed(FakeRequest('/feed/'))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.get_feed())
+
+
+
+class DisqusWxrCommandTest(TestCase):
+
+    def setUp(self):
+        self.real_sites_manager = Site.objects
+        Site.objects = FakeSiteManager('example.org', 'Example')
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'wxr')
+        self.state_file = os.path.join(self.tmpdir, 'state')
+
+    def tearDown(self):
+        Site.objects = self.real_sites_manager
+        shutil.rmtree(self.tmpdir)
+
+    def export(self, **options):
+        options.setdefault('verbosity', 0)
+        options.setdefault('feed', 'disqus.tests.FakeWxrFeed')
+        options.setdefault('output', self.output)
+        options.setdefault('state_file', self.state_file)
+        disqus_wxr.Command().handle(**options)
+
+    def read(self, chunk, part=0):
+        with open(disqus_wxr.get_chunk_path(self.output, chunk, part),
+                  'rb') as fp:
+            return fp.read()
+
+    def get_titles(self):
+        titles = []
+        for name in sorted(os.listdir(self.tmpdir)):
+            if name.endswith('.xml'):
+                with open(os.path.join(self.tmpdir, name), 'rb') as fp:
+                    dom = minidom.parse(fp)
+                titles.extend(node.firstChild.data for node in
+                              dom.getElementsByTagName('title'))
+        return titles
+
+    def test_chunks_by_item_count(self):
+        self.export(max_items=2)
+
+        self.assertEqual(self.read(0).count(b'<item>'), 2)
+        self.assertEqual(self.read(1).count(b'<item>'), 1)
+        self.assertEqual(self.get_titles(),
+                         ['Entry 0', 'Entry 1', 'Entry 2'])
+
+    def test_chunks_are_split_by_size(self):
+        self.export(max_items=3, max_bytes=1500)
+
+        for part in range(3):
+            output = self.read(0, part)
+            self.assertEqual(output.count(b'<item>'), 1)
+            self.assertTrue(output.endswith(b'</channel></rss>'))
+        self.assertEqual(self.get_titles(),
+                         ['Entry 0', 'Entry 1', 'Entry 2'])
+
+    def test_export_resumes_after_finished_chunks(self):
+        self.export(max_items=2)
+        os.remove(disqus_wxr.get_chunk_path(self.output, 0))
+        os.remove(disqus_wxr.get_chunk_path(self.output, 1))
+        with open(self.state_file) as fp:
+            state = json.load(fp)
+        del state['chunks']['1']
+        with open(self.state_file, 'w') as fp:
+            json.dump(state, fp)
+
+        self.export(max_items=2)
+
+        self.assertEqual(os.listdir(self.tmpdir).count('wxr-00000-000.xml'), 0)
+        self.assertEqual(self.get_titles(), ['Entry 2'])
+        with open(self.state_file) as fp:
+            self.assertEqual(sorted(json.load(fp)['chunks']), ['0', '1'])
+
+    def test_resumed_export_keeps_chunk_bounds(self):
+        self.export(max_items=2)
+        os.remove(disqus_wxr.get_chunk_path(self.output, 0))
+        os.remove(disqus_wxr.get_chunk_path(self.output, 1))
+        with open(self.state_file) as fp:
+            state = json.load(fp)
+        del state['chunks']['1']
+        with open(self.state_file, 'w') as fp:
+            json.dump(state, fp)
+
+        # the first entry was deleted in the meantime
+        with mock.patch.object(FakeWxrFeed, 'items',
+                               lambda self: self.entries[1:]):
+            self.export(max_items=2)
+
+        self.assertEqual(self.get_titles(), ['Entry 2'])
+
+    def test_chunk_items_are_not_filtered_twice(self):
+        with mock.patch.object(FakeWxrFeed, 'filter_items',
+                               autospec=True,
+                               side_effect=lambda self, items: items) as m:
+            disqus_wxr.export_chunk('disqus.tests.FakeWxrFeed', 0, None, 1,
+                                    self.output)
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(self.get_titles(), ['Entry 0', 'Entry 1'])
+
+    def test_export_with_different_options_is_not_resumed(self):
+        self.export(max_items=2)
+
+        self.assertRaises(CommandError, self.export, max_items=3)
+
+    def test_export_with_workers(self):
+        self.export(max_items=1, workers=2)
+
+        self.assertEqual(self.get_titles(),
+                         ['Entry 0', 'Entry 1', 'Entry 2'])
+
+    @override_settings(DISQUS_WXR_FEED=None)
+    def test_export_without_feed(self):
+        self.assertRaises(CommandError, self.export, feed=None)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,20 +1,108 @@
+import codecs
+import copy
+from collections import defaultdict
 import datetime
+from itertools import islice
+from xml.sax.saxutils import quoteattr
 
 from django import template
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.contrib.syndication.views import Feed, add_domain
-from django.utils import feedgenerator, tzinfo
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
+from django.http import Http404, HttpResponseBadRequest
+from django.utils import feedgenerator, six, timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.encoding import iri_to_uri
+from django.utils.xmlutils import SimplerXMLGenerator
+try:
+    from django.db.models.functions import Cast
+except ImportError:
+    # Django < 1.10
+    Cast = None
 try:
     from django.utils.encoding import force_text
 except ImportError:
     # Django < 1.5
     from django.utils.encoding import force_unicode as force_text
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # Django < 1.5
+    from django.http import HttpResponse as StreamingHttpResponse
 
 USE_SINGLE_SIGNON = getattr(settings, "DISQUS_USE_SINGLE_SIGNON", False)
 
+_MISSING = object()
+
+
+class ChunkBuffer(object):
+    """A file-like object that collects written data until it is popped."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """Return and forget everything written since the last pop."""
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+class WxrComment(object):
+    """
+    A comment of a WXR feed item. The fields can be read as attributes or
+    by key, like a dict.
+    """
+    __slots__ = ('user_id', 'avatar', 'id', 'user_name', 'user_email',
+                 'user_url', 'ip_address', 'submit_date', 'comment',
+                 'is_approved', 'parent')
+
+    def __init__(self, user_id, avatar, id, user_name, user_email, user_url,
+                 ip_address, submit_date, comment, is_approved, parent):
+        self.user_id = user_id
+        self.avatar = avatar
+        self.id = id
+        self.user_name = user_name
+        self.user_email = user_email
+        self.user_url = user_url
+        self.ip_address = ip_address
+        self.submit_date = submit_date
+        self.comment = comment
+        self.is_approved = is_approved
+        self.parent = parent
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __eq__(self, other):
+        return (isinstance(other, WxrComment) and
+                [self[key] for key in self.__slots__] ==
+                [other[key] for key in self.__slots__])
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return '<WxrComment %s>' % self.id
+
+
 class WxrFeedType(feedgenerator.Rss201rev2Feed):
     def rss_attributes(self):
         return {
@@ -28,15 +116,22 @@ class WxrFeedType(feedgenerator.Rss201rev2Feed):
     def format_date(self, date):
         return date.strftime('%Y-%m-%d %H:%M:%S')
     
-    def add_item(self, title, link, description, author_email=None,
-        author_name=None, author_link=None, pubdate=None, comments=None,
-        unique_id=None, enclosure=None, categories=(), item_copyright=None,
-        ttl=None, **kwargs):
+    def add_item(self, *args, **kwargs):
         """
         Adds an item to the feed. All args are expected to be Python Unicode
         objects except pubdate, which is a datetime.datetime object, and
         enclosure, which is an instance of the Enclosure class.
         """
+        self.items.append(self.make_item(*args, **kwargs))
+
+    def make_item(self, title, link, description, author_email=None,
+        author_name=None, author_link=None, pubdate=None, comments=None,
+        unique_id=None, enclosure=None, categories=(), item_copyright=None,
+        ttl=None, **kwargs):
+        """
+        Returns the item dict that `add_item` adds to the feed. `comments`
+        may be any iterable, it is only iterated when the item is written.
+        """
         to_unicode = lambda s: force_text(s, strings_only=True)
         if categories:
             categories = [to_unicode(c) for c in categories]
@@ -59,7 +154,28 @@ class WxrFeedType(feedgenerator.Rss201rev2Feed):
             'ttl': ttl,
         }
         item.update(kwargs)
-        self.items.append(item)
+        return item
+
+    def stream(self, encoding):
+        """
+        Yields the feed as encoded XML, one chunk per item. `self.items`
+        may be a generator, so items don't have to be kept in memory.
+        """
+        buf = ChunkBuffer()
+        handler = SimplerXMLGenerator(buf, encoding)
+        handler.startDocument()
+        handler.startElement("rss", self.rss_attributes())
+        handler.startElement("channel", self.root_attributes())
+        self.add_root_elements(handler)
+        yield buf.pop()
+        for item in self.items:
+            handler.startElement('item', self.item_attributes(item))
+            self.add_item_elements(handler, item)
+            handler.endElement("item")
+            yield buf.pop()
+        self.endChannelElement(handler)
+        handler.endElement("rss")
+        yield buf.pop()
     
     def add_root_elements(self, handler):
         pass
@@ -101,98 +217,583 @@ class WxrFeedType(feedgenerator.Rss201rev2Feed):
             handler.endElement('wp:comment')
 
 
+
+def _escape(text):
+    """Escapes &, < and > like `xml.sax.saxutils.escape`, but faster."""
+    if u'&' in text:
+        text = text.replace(u'&', u'&amp;')
+    if u'>' in text:
+        text = text.replace(u'>', u'&gt;')
+    if u'<' in text:
+        text = text.replace(u'<', u'&lt;')
+    return text
+
+
+def _tags(name):
+    return u'<%s>' % name, u'</%s>' % name
+
+_TITLE = _tags('title')
+_LINK = _tags('link')
+_CONTENT = _tags('content:encoded')
+_THREAD_IDENTIFIER = _tags('dsq:thread_identifier')
+_POST_DATE = _tags('wp:post_date_gmt')
+_COMMENT_STATUS = _tags('wp:comment_status')
+_COMMENT = _tags('wp:comment')
+_REMOTE = _tags('dsq:remote')
+_REMOTE_ID = _tags('dsq:id')
+_REMOTE_AVATAR = _tags('dsq:avatar')
+_COMMENT_ID = _tags('wp:comment_id')
+_COMMENT_AUTHOR = _tags('wp:comment_author')
+_COMMENT_AUTHOR_EMAIL = _tags('wp:comment_author_email')
+_COMMENT_AUTHOR_URL = _tags('wp:comment_author_url')
+_COMMENT_AUTHOR_IP = _tags('wp:comment_author_IP')
+_COMMENT_DATE = _tags('wp:comment_date_gmt')
+_COMMENT_CONTENT = _tags('wp:comment_content')
+_COMMENT_APPROVED = _tags('wp:comment_approved')
+_COMMENT_PARENT = _tags('wp:comment_parent')
+
+
+class FastWxrFeedType(WxrFeedType):
+    """
+    A WxrFeedType that writes items and their comments as encoded strings
+    instead of through `SimplerXMLGenerator`, with the same output.
+    
+    Subclasses that override `add_item_elements`, `add_comment_elements`
+    or `write_comments`, and encodings with a byte order mark, are written
+    with `SimplerXMLGenerator`.
+    """
+    
+    def write(self, outfile, encoding):
+        for chunk in self.stream(encoding):
+            outfile.write(chunk)
+    
+    def stream(self, encoding):
+        cls = type(self)
+        if (cls.add_item_elements != WxrFeedType.add_item_elements or
+                cls.add_comment_elements != WxrFeedType.add_comment_elements or
+                cls.write_comments != WxrFeedType.write_comments or
+                codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32'))):
+            for chunk in super(FastWxrFeedType, self).stream(encoding):
+                yield chunk
+            return
+        buf = ChunkBuffer()
+        handler = SimplerXMLGenerator(buf, encoding)
+        handler.startDocument()
+        handler.startElement("rss", self.rss_attributes())
+        handler.startElement("channel", self.root_attributes())
+        self.add_root_elements(handler)
+        yield buf.pop()
+        for item in self.items:
+            yield self.serialize_item(item, encoding)
+        self.endChannelElement(handler)
+        handler.endElement("rss")
+        yield buf.pop()
+    
+    def serialize_item(self, item, encoding):
+        """Returns the encoded <item> element of `item`."""
+        parts = []
+        append = parts.append
+        text_type = six.text_type
+        
+        def element(tags, content):
+            # Like SimplerXMLGenerator.addQuickElement
+            append(tags[0])
+            if content is not None:
+                if not isinstance(content, text_type):
+                    content = text_type(content, encoding)
+                append(_escape(content))
+            append(tags[1])
+        
+        attrs = self.item_attributes(item)
+        if attrs:
+            append(u'<item%s>' % u''.join(u' %s=%s' % (name, quoteattr(value))
+                                          for name, value in attrs.items()))
+        else:
+            append(u'<item>')
+        if item['comments'] is not None:
+            element(_TITLE, item['title'])
+            element(_LINK, item['link'])
+            element(_CONTENT, item['description'])
+            element(_THREAD_IDENTIFIER, item['unique_id'])
+            element(_POST_DATE, self._format_date(item['pubdate']))
+            element(_COMMENT_STATUS, item['comment_status'])
+            for comment in item['comments']:
+                append(_COMMENT[0])
+                if USE_SINGLE_SIGNON:
+                    append(_REMOTE[0])
+                    element(_REMOTE_ID, comment['user_id'])
+                    element(_REMOTE_AVATAR, comment['avatar'])
+                    append(_REMOTE[1])
+                element(_COMMENT_ID, comment['id'])
+                element(_COMMENT_AUTHOR, comment['user_name'])
+                element(_COMMENT_AUTHOR_EMAIL, comment['user_email'])
+                element(_COMMENT_AUTHOR_URL, comment['user_url'])
+                element(_COMMENT_AUTHOR_IP, comment['ip_address'])
+                element(_COMMENT_DATE,
+                        self._format_date(comment['submit_date']))
+                element(_COMMENT_CONTENT, comment['comment'])
+                element(_COMMENT_APPROVED, comment['is_approved'])
+                if comment['parent'] is not None:
+                    element(_COMMENT_PARENT, comment['parent'])
+                append(_COMMENT[1])
+        append(u'</item>')
+        return u''.join(parts).encode(encoding, 'xmlcharrefreplace')
+    
+    def _format_date(self, date):
+        """
+        Returns `format_date(date)` as text. Datetimes are formatted with
+        `isoformat`, which is faster than `strftime`, and the last date is
+        cached, since the comments of an item often share it.
+        """
+        if date is self._last_date:
+            return self._last_formatted_date
+        if (type(self).format_date == WxrFeedType.format_date and
+                isinstance(date, datetime.datetime) and date.year >= 1900):
+            formatted = date.isoformat(' ')[:19]
+        else:
+            formatted = self.format_date(date).decode('utf-8')
+        self._last_date, self._last_formatted_date = date, formatted
+        return formatted
+    
+    _last_date = _last_formatted_date = _MISSING
+
+
 class BaseWxrFeed(Feed):
     feed_type = WxrFeedType
-    
+    # Stream the response instead of building the whole feed in memory
+    stream = False
+    # Number of items whose comments are fetched with one prefetch_comments
+    comments_chunk_size = 100
+    # Cache for rendered title and description templates, e.g. a
+    # disqus.api.LRUCache or DjangoCache. Used for items with item_modified.
+    fragment_cache = None
+    # Order the comments of an item so that parents precede their replies
+    threaded = False
+
+    def __call__(self, request, *args, **kwargs):
+        if not self.stream:
+            return super(BaseWxrFeed, self).__call__(request, *args, **kwargs)
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+        feedgen = self.get_streaming_feed(obj, request)
+        return StreamingHttpResponse(feedgen.stream('utf-8'),
+                                     content_type=feedgen.mime_type)
+
     def get_feed(self, obj, request):
         current_site = Site.objects.get_current()
-        
+        feed = self._get_feed_type(obj, current_site)
+        for item in self._get_items(obj, request, current_site,
+                                    self._get_comments):
+            feed.add_item(**item)
+        return feed
+
+    def get_streaming_feed(self, obj, request):
+        """
+        Like `get_feed`, but the items and their comments are only fetched
+        while the feed is written with `stream()`.
+        """
+        current_site = Site.objects.get_current()
+        feed = self._get_feed_type(obj, current_site)
+        feed.items = (feed.make_item(**item) for item in
+                      self._get_items(obj, request, current_site,
+                                      self._iter_comments, lazy=True))
+        return feed
+
+    def write_feed(self, outfile, obj=None, request=None, encoding='utf-8'):
+        """Streams the feed into the file-like object `outfile`."""
+        for chunk in self.get_streaming_feed(obj, request).stream(encoding):
+            outfile.write(chunk)
+
+    def _get_feed_type(self, obj, current_site):
         link = self._Feed__get_dynamic_attr('link', obj)
         link = add_domain(current_site.domain, link)
-        feed = self.feed_type(
+        return self.feed_type(
             title = self._Feed__get_dynamic_attr('title', obj),
             link = link,
             description = self._Feed__get_dynamic_attr('description', obj),
         )
+
+    def _get_items(self, obj, request, current_site, get_comments,
+                   lazy=False):
+        """
+        Yields the keyword arguments of `add_item` for each item. If `lazy`
+        is set, querysets of items are iterated without caching them.
+        """
+        title_tmp = self._get_template(self.title_template)
+        description_tmp = self._get_template(self.description_template)
+        context = None
+        if title_tmp is not None or description_tmp is not None:
+            context = self._get_base_context(
+                request, {'site': current_site}, title_tmp or description_tmp)
+        domain = current_site.domain
         
-        title_tmp = None
-        if self.title_template is not None:
-            try:
-                title_tmp = template.loader.get_template(self.title_template)
-            except template.TemplateDoesNotExist:
-                pass
-        
-        description_tmp = None
-        if self.description_template is not None:
-            try:
-                description_tmp = template.loader.get_template(self.description_template)
-            except template.TemplateDoesNotExist:
-                pass
+        item_title = self._get_accessor('item_title')
+        item_description = self._get_accessor('item_description')
+        item_link = self._get_accessor('item_link')
+        item_pubdate = self._get_accessor('item_pubdate')
+        item_guid = self._get_accessor('item_guid', _MISSING)
+        item_comment_status = self._get_accessor('item_comment_status', 'open')
+        item_modified = self._get_accessor('item_modified')
+        extract = self._get_comment_extractor()
         
-        for item in self._Feed__get_dynamic_attr('items', obj):
+        items = self.filter_items(self._Feed__get_dynamic_attr('items', obj))
+        if lazy and hasattr(items, 'iterator'):
+            items = items.iterator()
+        for item, comments in self._prefetch_chunks(items):
+            link = add_domain(domain, item_link(item))
+            unique_id = item_guid(item)
+            if unique_id is _MISSING:
+                unique_id = link
+            
+            if context is not None:
+                modified = item_modified(item)
+                if modified is not None and self.fragment_cache is not None:
+                    key = '%s:%s:%s' % (domain, unique_id, modified)
+                else:
+                    key = None
             if title_tmp is not None:
-                title = title_tmp.render(
-                    template.RequestContext(request, {
-                        'obj': item, 'site': current_site
-                    }))
+                title = self._render_fragment(
+                    title_tmp, self.title_template, context, item, key)
             else:
-                title = self._Feed__get_dynamic_attr('item_title', item)
+                title = item_title(item)
             if description_tmp is not None:
-                description = description_tmp.render(
-                    template.RequestContext(request, {
-                        'obj': item, 'site': current_site
-                    }))
+                description = self._render_fragment(
+                    description_tmp, self.description_template, context,
+                    item, key)
             else:
-                description = self._Feed__get_dynamic_attr('item_description', item)
-            link = add_domain(
-                current_site.domain,
-                self._Feed__get_dynamic_attr('item_link', item),
-            )
+                description = item_description(item)
             
-            pubdate = self._Feed__get_dynamic_attr('item_pubdate', item)
+            pubdate = item_pubdate(item)
             if pubdate and not hasattr(pubdate, 'tzinfo'):
-                ltz = tzinfo.LocalTimezone(pubdate)
-                pubdate = pubdate.replace(tzinfo=ltz)
+                pubdate = timezone.make_aware(
+                    pubdate, timezone.get_default_timezone())
             
-            feed.add_item(
+            yield dict(
                 title = title,
                 link = link,
                 description = description,
-                unique_id = self._Feed__get_dynamic_attr('item_guid', item, link),
+                unique_id = unique_id,
                 pubdate = pubdate,
-                comment_status = self._Feed__get_dynamic_attr('item_comment_status', item, 'open'),
-                comments = self._get_comments(item)
+                comment_status = item_comment_status(item),
+                comments = get_comments(item, comments, extract)
             )
-        return feed
-    
-    def _get_comments(self, item):
-        cmts = self._Feed__get_dynamic_attr('item_comments', item)
-        output = []
-        for comment in cmts:
-            output.append({
-                'user_id': self._Feed__get_dynamic_attr('comment_user_id', comment),
-                'avatar': self._Feed__get_dynamic_attr('comment_avatar', comment),
-                'id': str(self._Feed__get_dynamic_attr('comment_id', comment)),
-                'user_name': self._Feed__get_dynamic_attr('comment_user_name', comment),
-                'user_email': self._Feed__get_dynamic_attr('comment_user_email', comment),
-                'user_url': self._Feed__get_dynamic_attr('comment_user_url', comment),
-                'ip_address': self._Feed__get_dynamic_attr('comment_ip_address', comment),
-                'submit_date': self._Feed__get_dynamic_attr('comment_submit_date', comment),
-                'comment': self._Feed__get_dynamic_attr('comment_comment', comment),
-                'is_approved': str(self._Feed__get_dynamic_attr('comment_is_approved', comment)),
-                'parent': str(self._Feed__get_dynamic_attr('comment_parent', comment)),
-            })
-        return output
+
+    def _get_accessor(self, attname, default=None):
+        """
+        Returns a function that returns the dynamic attribute `attname` for
+        an object, like `Feed.__get_dynamic_attr`, but looks up and
+        inspects the attribute only once.
+        """
+        try:
+            attr = getattr(self, attname)
+        except AttributeError:
+            return lambda obj: default
+        if callable(attr):
+            try:
+                code = six.get_function_code(attr)
+            except AttributeError:
+                code = six.get_function_code(attr.__call__)
+            if code.co_argcount == 2:       # one argument is 'self'
+                return attr
+            return lambda obj: attr()
+        return lambda obj: attr
+
+    def _get_comment_extractor(self):
+        """Returns a function that turns a comment into a WxrComment."""
+        user_id = self._get_accessor('comment_user_id')
+        avatar = self._get_accessor('comment_avatar')
+        id_ = self._get_accessor('comment_id')
+        user_name = self._get_accessor('comment_user_name')
+        user_email = self._get_accessor('comment_user_email')
+        user_url = self._get_accessor('comment_user_url')
+        ip_address = self._get_accessor('comment_ip_address')
+        submit_date = self._get_accessor('comment_submit_date')
+        comment_ = self._get_accessor('comment_comment')
+        is_approved = self._get_accessor('comment_is_approved')
+        parent = self._get_accessor('comment_parent')
+        
+        def extract(comment):
+            return WxrComment(
+                user_id(comment),
+                avatar(comment),
+                str(id_(comment)),
+                user_name(comment),
+                user_email(comment),
+                user_url(comment),
+                ip_address(comment),
+                submit_date(comment),
+                comment_(comment),
+                str(is_approved(comment)),
+                str(parent(comment)),
+            )
+        return extract
+
+    def _prefetch_chunks(self, items):
+        """
+        Yields `(item, comments)` tuples, where comments were fetched by
+        `prefetch_comments` for a chunk of items at a time, or are None.
+        """
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, self.comments_chunk_size))
+            if not chunk:
+                return
+            comments = self.prefetch_comments(chunk) or [None] * len(chunk)
+            for pair in zip(chunk, comments):
+                yield pair
+
+    def filter_items(self, items):
+        """Returns the items that are exported, out of all `items`."""
+        return items
+
+    def prefetch_comments(self, items):
+        """
+        Returns a list with the comments of each of the `items`, or None
+        if the comments of each item should be fetched by `item_comments`.
+        """
+        return None
+
+    def _get_template(self, template_name):
+        """
+        Returns the template `template_name`, or None if it is not set or
+        doesn't exist.
+        """
+        if template_name is None:
+            return None
+        try:
+            tmp = template.loader.get_template(template_name)
+        except template.TemplateDoesNotExist:
+            return None
+        # Django >= 1.8 wraps the template of the engine, which is rendered
+        # with a Context instead of a dict.
+        return getattr(tmp, 'template', tmp)
+
+    def _get_base_context(self, request, context, tmp):
+        """
+        Returns the context that item templates are rendered with. It is
+        created once per feed, so the context processors run only once.
+        """
+        context = self._get_context(request, context)
+        if request is not None and hasattr(context, 'bind_template'):
+            # Django >= 1.8 runs the context processors whenever a template
+            # is rendered with a RequestContext.
+            with context.bind_template(tmp):
+                context = template.Context(context.flatten())
+        return context
+
+    def _render_fragment(self, tmp, template_name, context, item, key=None):
+        """
+        Renders `tmp` for `item`. If `key` is given, the result is looked up
+        in and stored to `fragment_cache`.
+        """
+        if key is not None:
+            key = '%s:%s' % (template_name, key)
+            fragment = self.fragment_cache.get(key)
+            if fragment is not None:
+                return fragment
+        context.update({'obj': item})
+        try:
+            fragment = tmp.render(context)
+        finally:
+            context.pop()
+        if key is not None:
+            self.fragment_cache.set(key, fragment)
+        return fragment
+
+    def _get_context(self, request, context):
+        """
+        Returns the context for item templates. Without a request, like
+        when the feed is written to a file, no context processors are run.
+        """
+        if request is None:
+            return template.Context(context)
+        return template.RequestContext(request, context)
+
+    def _get_comments(self, item, cmts=None, extract=None):
+        return list(self._iter_comments(item, cmts, extract))
+
+    def _iter_comments(self, item, cmts=None, extract=None):
+        if cmts is None:
+            cmts = self._Feed__get_dynamic_attr('item_comments', item)
+        if extract is None:
+            extract = self._get_comment_extractor()
+        if not self.threaded:
+            for comment in cmts:
+                yield extract(comment)
+            return
+        for comment in self._thread_comments([extract(c) for c in cmts]):
+            yield comment
+
+    def _thread_comments(self, comments, keep_missing=False):
+        """
+        Returns the WxrComments of an item ordered so that every parent
+        precedes its replies, with replies following their parent. Parents
+        are looked up in a map of the comments' ids, so no queries are
+        needed. Parents that are not among the comments are set to 0, unless
+        `keep_missing` is set. Cycles are broken by setting the parent of
+        one of their comments to 0.
+        """
+        by_id = dict((comment.id, comment) for comment in comments)
+        replies = defaultdict(list)
+        roots = []
+        for comment in comments:
+            if comment.parent in by_id and comment.parent != comment.id:
+                replies[comment.parent].append(comment)
+            else:
+                if not keep_missing:
+                    comment.parent = '0'
+                roots.append(comment)
+        
+        ordered = []
+        stack = roots[::-1]
+        while True:
+            while stack:
+                comment = stack.pop()
+                ordered.append(comment)
+                stack.extend(reversed(replies.pop(comment.id, ())))
+            if not replies:
+                return ordered
+            # The remaining comments are part of cycles or replies to them.
+            # Follow the parents of one of them until a comment repeats,
+            # which is in a cycle, and detach it from its parent.
+            comment = next(c for c in comments if c.parent in replies)
+            seen = set()
+            while comment.id not in seen:
+                seen.add(comment.id)
+                comment = by_id[comment.parent]
+            siblings = [c for c in replies.pop(comment.parent)
+                        if c is not comment]
+            if siblings:
+                replies[comment.parent] = siblings
+            comment.parent = '0'
+            stack.append(comment)
         
 
 class ContribCommentsWxrFeed(BaseWxrFeed):
     link = "/"
+    threaded = True
+    # Attribute of threaded comment models that holds the parent's id
+    comment_parent_field = 'parent_id'
+    # Only export comments submitted after this datetime
+    since = None
     
-    def item_comments(self, item):
-        from django.contrib.comments.models import Comment
+    def __init__(self, since=None):
+        if since is not None:
+            self.since = since
+    
+    def __call__(self, request, *args, **kwargs):
+        since = request.GET.get('since')
+        if not since:
+            return super(ContribCommentsWxrFeed, self).__call__(
+                request, *args, **kwargs)
+        try:
+            since = parse_datetime(since) or parse_date(since)
+        except ValueError:
+            since = None
+        if since is None:
+            return HttpResponseBadRequest('Invalid since parameter.')
+        if not isinstance(since, datetime.datetime):
+            since = datetime.datetime.combine(since, datetime.time())
+        # The feed is shared by all requests, so the since of this request
+        # is set on a copy.
+        feed = copy.copy(self)
+        feed.since = since
+        return super(ContribCommentsWxrFeed, feed).__call__(
+            request, *args, **kwargs)
+    
+    def get_since(self):
+        """
+        Returns `since` as an aware datetime if time zones are used, and as
+        a naive one in the current time zone otherwise.
+        """
+        since = self.since
+        if since is None:
+            return since
+        if settings.USE_TZ and timezone.is_naive(since):
+            since = timezone.make_aware(since, timezone.get_current_timezone())
+        elif not settings.USE_TZ and timezone.is_aware(since):
+            since = timezone.make_naive(since, timezone.get_current_timezone())
+        return since
+    
+    def filter_items(self, items):
+        """
+        If `since` is set, returns only the items with comments submitted
+        after it. Querysets are filtered in the database with a subquery.
+        """
+        since = self.get_since()
+        if since is None:
+            return items
+        comments = self.get_comment_model().objects.filter(
+            submit_date__gt=since)
+        if hasattr(items, 'model') and items.query.can_filter():
+            ctype = ContentType.objects.get_for_model(items.model)
+            return items.filter(pk__in=self._get_object_pks(
+                comments.filter(content_type=ctype), items))
+        changed = set(
+            (ctype_id, force_text(object_pk)) for ctype_id, object_pk in
+            comments.values_list('content_type', 'object_pk').distinct())
+        return (item for item in items
+                if (ContentType.objects.get_for_model(item).pk,
+                    force_text(item.pk)) in changed)
+    
+    def _get_object_pks(self, comments, items):
+        """
+        Returns the `object_pk` of the `comments` as a subquery that can be
+        compared with the pks of the queryset `items`.
+        """
+        pk = items.model._meta.pk
+        if pk.get_internal_type() in ('CharField', 'TextField'):
+            return comments.values('object_pk')
+        if Cast is not None:
+            return comments.annotate(
+                item_pk=Cast('object_pk', pk)).values('item_pk')
+        if connections[items.db].vendor == 'postgresql':
+            # Django < 1.10 can't cast the object_pk, which PostgreSQL
+            # doesn't compare with other types
+            return list(comments.values_list('object_pk', flat=True)
+                        .distinct())
+        return comments.values('object_pk')
+    
+    def get_comment_model(self):
+        """
+        Returns the comment model, which can be changed with the
+        COMMENTS_APP setting, e.g. to a threaded comment model.
+        """
+        from django.contrib import comments
+        return comments.get_model()
+    
+    def _get_item_comments(self, **lookups):
+        comments = self.get_comment_model().objects.filter(**lookups)
+        since = self.get_since()
+        if since is not None:
+            comments = comments.filter(submit_date__gt=since)
+        return comments
+    
+    def prefetch_comments(self, items):
+        """
+        Fetches the comments of all items with one query per content type,
+        unless `item_comments` is overridden.
+        """
+        if type(self).item_comments != ContribCommentsWxrFeed.item_comments:
+            return None
         
+        keys = [(ContentType.objects.get_for_model(item), force_text(item.pk))
+                for item in items]
+        object_pks = defaultdict(list)
+        for ctype, object_pk in keys:
+            object_pks[ctype].append(object_pk)
+        comments = defaultdict(list)
+        for ctype, pks in object_pks.items():
+            for comment in self._get_item_comments(content_type=ctype,
+                                                   object_pk__in=pks):
+                comments[(ctype, comment.object_pk)].append(comment)
+        return [comments[key] for key in keys]
+    
+    def item_comments(self, item):
         ctype = ContentType.objects.get_for_model(item)
-        return Comment.objects.filter(content_type=ctype, object_pk=item.pk)
+        return self._get_item_comments(content_type=ctype, object_pk=item.pk)
     
     def item_guid(self, item):
         ctype = ContentType.objects.get_for_model(item)
@@ -225,4 +826,15 @@ class ContribCommentsWxrFeed(BaseWxrFeed):
     def comment_is_approved(self, comment):
         return int(comment.is_public)
     
-    comment_parent = 0
+    def comment_parent(self, comment):
+        """
+        Returns the id of the comment's parent, or 0. The id is read from
+        `comment_parent_field`, so the parent isn't fetched.
+        """
+        return getattr(comment, self.comment_parent_field, None) or 0
+    
+    def _thread_comments(self, comments, keep_missing=False):
+        # With since, the parents of new comments may have been exported
+        # before.
+        return super(ContribCommentsWxrFeed, self)._thread_comments(
+            comments, keep_missing or self.since is not None)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+Benchmarks for django-disqus.
+
+The API client and the management commands run against the fake DISQUS
+API of `disqus.fakeapi`, which answers after a configurable latency. For every
+benchmark the throughput, the latency percentiles of single runs and the
+peak memory are reported.
+
+Usage: ./runbenchmarks.py [options] [benchmark ...]
+"""
+import datetime
+from multiprocessing.pool import ThreadPool
+from optparse import OptionParser
+import os
+import pkgutil
+import sys
+import time
+from os.path import dirname, abspath
+
+import django
+from django.conf import settings
+
+HAS_COMMENTS = pkgutil.find_loader('django.contrib.comments') is not None
+
+if not settings.configured:
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            },
+        },
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'django.contrib.sites',
+            'django.contrib.flatpages',
+            'disqus',
+        ] + (['django.contrib.comments'] if HAS_COMMENTS else []),
+        SITE_ID=1,
+        ROOT_URLCONF='',
+        DEBUG=False,
+        DISQUS_API_KEY='spam',
+        DISQUS_WEBSITE_SHORTNAME='ham',
+        DISQUS_SECRET_KEY='eggs',
+        DISQUS_PUBLIC_KEY='bacon',
+    )
+    if hasattr(django, 'setup'):
+        django.setup()
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from django.core.management import call_command
+from django.template import Context, Template
+from django.utils.six import BytesIO, StringIO
+from django.utils.six.moves.urllib.response import addinfourl
+
+from disqus.api import ConnectionPool, DecompressingReader, DisqusClient
+from disqus.fakeapi import FakeApiServer, FakeApiStore
+from disqus.wxr_feed import BaseWxrFeed, FastWxrFeedType, WxrFeedType
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+BODY = b'{"message": [], "code": "ok", "succeeded": true}'
+
+
+class CannedClient(DisqusClient):
+    """A client that answers every request without sending it."""
+
+    def _send(self, request, http_method):
+        return DecompressingReader(
+            addinfourl(BytesIO(BODY), {}, request.get_full_url(), 200))
+
+
+def bench_method_lookup(options, server):
+    client = DisqusClient()
+
+    def lookup():
+        for i in range(10000):
+            client.get_thread_posts
+    return lookup, 10000
+
+
+def bench_call_overhead(options, server):
+    client = CannedClient(default_params={'forum_api_key': 'spam'})
+
+    def call():
+        for i in range(100):
+            client.get_thread_posts(thread_id='1', limit=100)
+    return call, 100
+
+
+def bench_client(options, server):
+    client = DisqusClient(api_url=server.api_url, pool=ConnectionPool(),
+                          default_params={'forum_api_key': 'ham-key'})
+    thread_id = list(server.store.threads)[0]
+    return lambda: client.get_thread_posts(thread_id=thread_id, limit=100), 1
+
+
+def bench_client_threads(options, server):
+    client = DisqusClient(api_url=server.api_url,
+                          pool=ConnectionPool(maxsize=options.workers),
+                          default_params={'forum_api_key': 'ham-key'})
+    pool = ThreadPool(options.workers)
+    thread_ids = list(server.store.threads)[:10 * options.workers]
+
+    def call():
+        pool.map(lambda thread_id: client.get_thread_posts(
+            thread_id=thread_id), thread_ids)
+    return call, len(thread_ids)
+
+
+def create_comments(options):
+    """Create flat pages with 10 comments each, once."""
+    from django.contrib.comments.models import Comment
+    from django.contrib.flatpages.models import FlatPage
+
+    if FlatPage.objects.exists():
+        return
+    pages = [FlatPage.objects.create(url='/page-%d/' % i, title='Page %d' % i)
+             for i in range(max(options.comments // 10, 1))]
+    now = datetime.datetime.now()
+    Comment.objects.bulk_create([
+        Comment(content_object=pages[i % len(pages)], site_id=1,
+                user_name='User %d' % i, user_email='user@example.org',
+                comment='Comment number %d' % i, submit_date=now)
+        for i in range(options.comments)])
+
+
+def bench_export(options, server):
+    if not HAS_COMMENTS:
+        return None
+    create_comments(options)
+
+    def export():
+        call_command('disqus_export', verbosity=0, workers=options.workers)
+    return export, options.comments
+
+
+def bench_dumpdata(options, server):
+    output = os.devnull
+
+    def dumpdata():
+        call_command('disqus_dumpdata', output=output,
+                     prefetch=options.workers - 1)
+    return dumpdata, len(server.store.posts)
+
+
+def bench_wxr_feed(options, server, feed_type=WxrFeedType):
+    now = datetime.datetime.now()
+    feed = feed_type(title='Feed', link='http://example.org/',
+                     description='')
+    comments = [{
+        'user_id': '1', 'avatar': '', 'id': str(i), 'user_name': 'User',
+        'user_email': 'user@example.org', 'user_url': '',
+        'ip_address': '127.0.0.1', 'submit_date': now,
+        'comment': 'Comment number %d' % i, 'is_approved': '1',
+        'parent': '0',
+    } for i in range(10)]
+    for i in range(max(options.comments // 10, 1)):
+        feed.add_item(title='Item %d' % i, link='http://example.org/%d/' % i,
+                      description='', unique_id='item_%d' % i,
+                      pubdate=now, comment_status='open', comments=comments)
+
+    def write():
+        feed.write(StringIO(), 'utf-8')
+    return write, len(feed.items) * len(comments)
+
+
+def bench_wxr_fast(options, server):
+    return bench_wxr_feed(options, server, FastWxrFeedType)
+
+
+class GeneratedWxrFeed(BaseWxrFeed):
+    """A WXR feed of generated items with 10 comments each."""
+    link = '/'
+    title = 'Feed'
+    description = ''
+    comment_user_id = comment_avatar = comment_user_url = ''
+    comment_ip_address = '127.0.0.1'
+    comment_user_name = 'User'
+    comment_user_email = 'user@example.org'
+    comment_is_approved = 1
+    comment_parent = 0
+
+    def __init__(self, count):
+        self.count = count
+        self.now = datetime.datetime.now()
+
+    def items(self):
+        return range(self.count)
+
+    def item_title(self, item):
+        return 'Item %d' % item
+
+    def item_description(self, item):
+        return ''
+
+    def item_link(self, item):
+        return '/%d/' % item
+
+    def item_pubdate(self, item):
+        return self.now
+
+    def item_comments(self, item):
+        return range(item * 10, item * 10 + 10)
+
+    def comment_id(self, comment):
+        return comment
+
+    def comment_submit_date(self, comment):
+        return self.now
+
+    def comment_comment(self, comment):
+        return 'Comment number %d' % comment
+
+
+def bench_wxr_buffered(options, server):
+    feed = GeneratedWxrFeed(max(options.comments // 10, 1))
+
+    def write():
+        feed.get_feed(None, None).write(StringIO(), 'utf-8')
+    return write, feed.count * 10
+
+
+def bench_wxr_streaming(options, server):
+    feed = GeneratedWxrFeed(max(options.comments // 10, 1))
+
+    def write():
+        feed.write_feed(StringIO())
+    return write, feed.count * 10
+
+
+def bench_wxr_comments(options, server):
+    feed = GeneratedWxrFeed(1)
+    comments = range(options.comments)
+
+    def get_comments():
+        feed._get_comments(0, comments)
+    return get_comments, options.comments
+
+
+def bench_wxr_contrib(options, server):
+    if not HAS_COMMENTS:
+        return None
+    from django.contrib.flatpages.models import FlatPage
+    from disqus.wxr_feed import ContribCommentsWxrFeed
+
+    class FlatPageWxrFeed(ContribCommentsWxrFeed):
+        def items(self):
+            return FlatPage.objects.order_by('pk')
+
+        def item_pubdate(self, item):
+            return datetime.datetime.now()
+
+        def item_link(self, item):
+            return item.url
+    create_comments(options)
+    feed = FlatPageWxrFeed()
+
+    def write():
+        feed.write_feed(StringIO())
+    return write, options.comments
+
+
+def bench_template_tags(options, server):
+    template = Template(
+        '{% load disqus_tags %}'
+        '{% set_disqus_identifier "page-1" %}'
+        '{% set_disqus_url "http://example.org/page-1/" %}'
+        '{% set_disqus_title "Page 1" %}'
+        '{% disqus_show_comments %}'
+        '{% disqus_num_replies %}'
+        '{% disqus_recent_comments %}'
+        '{% disqus_sso %}')
+
+    class User(object):
+        id = 1
+        username = 'user'
+        email = 'user@example.org'
+
+        def is_anonymous(self):
+            return False
+    context = Context({'user': User()})
+
+    def render():
+        for i in range(100):
+            template.render(context)
+    return render, 100
+
+
+BENCHMARKS = [
+    ('method_lookup', bench_method_lookup),
+    ('call_overhead', bench_call_overhead),
+    ('client', bench_client),
+    ('client_threads', bench_client_threads),
+    ('dumpdata', bench_dumpdata),
+    ('export', bench_export),
+    ('wxr_feed', bench_wxr_feed),
+    ('wxr_fast', bench_wxr_fast),
+    ('wxr_buffered', bench_wxr_buffered),
+    ('wxr_streaming', bench_wxr_streaming),
+    ('wxr_comments', bench_wxr_comments),
+    ('wxr_contrib', bench_wxr_contrib),
+    ('template_tags', bench_template_tags),
+]
+
+
+def percentile(timings, percent):
+    """Return the `percent` percentile of the sorted `timings`."""
+    return timings[min(int(len(timings) * percent / 100.0),
+                       len(timings) - 1)]
+
+
+def measure(operation, number):
+    """
+    Run `operation` `number` times and return the timings of the runs and
+    the peak memory in MB. Without tracemalloc the peak memory is the
+    maximum resident set size of the process.
+    """
+    if tracemalloc is not None:
+        tracemalloc.start()
+    timings = []
+    for i in range(number):
+        start = time.time()
+        operation()
+        timings.append(time.time() - start)
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1] / 1024.0 / 1024.0
+        tracemalloc.stop()
+    elif resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    else:
+        peak = float('nan')
+    return sorted(timings), peak
+
+
+def runbenchmarks(options, names):
+    call_command('migrate' if django.VERSION >= (1, 7) else 'syncdb',
+                 verbosity=0, interactive=False)
+    store = FakeApiStore(user_api_key=settings.DISQUS_API_KEY)
+    store.populate(settings.DISQUS_WEBSITE_SHORTNAME,
+                   threads=max(options.comments // 10, 1))
+    server = FakeApiServer(store, latency=options.latency / 1000.0).start()
+    settings.DISQUS_API_URL = server.api_url
+    print("%-16s %12s %10s %10s %10s %9s" % (
+        'benchmark', 'items/s', 'p50 ms', 'p95 ms', 'p99 ms', 'peak MB'))
+    try:
+        for name, setup in BENCHMARKS:
+            if names and name not in names:
+                continue
+            benchmark = setup(options, server)
+            if benchmark is None:
+                print("%-16s skipped" % name)
+                continue
+            operation, items = benchmark
+            operation()
+            timings, peak = measure(operation, options.number)
+            print("%-16s %12.1f %10.3f %10.3f %10.3f %9.1f" % (
+                name, items * len(timings) / sum(timings),
+                percentile(timings, 50) * 1000,
+                percentile(timings, 95) * 1000,
+                percentile(timings, 99) * 1000, peak))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('-n', '--number', type='int', default=20,
+                      help='Number of runs of each benchmark')
+    parser.add_option('-l', '--latency', type='float', default=0,
+                      help='Latency of the stand-in API in milliseconds')
+    parser.add_option('-w', '--workers', type='int', default=4,
+                      help='Number of concurrent requests')
+    parser.add_option('-c', '--comments', type='int', default=1000,
+                      help='Number of comments and posts to export and dump')
+    options, names = parser.parse_args()
+    runbenchmarks(options, names)